@@ -0,0 +1,17 @@
+import braid
+import braid_group
+import random
+import time
+
+# Benchmarks for braids. Run as a script, e.g. `python bench_braid.py`.
+random.seed(0)
+num_strands = 7
+
+# Benchmark braid construction as a function of word length ------------------
+for word_length in [10, 30, 100, 300, 1000]:
+  codes = [random.choice([1, -1]) * random.randint(1, num_strands - 1) for _ in range(word_length)]
+  word = braid_group.Word.FromCodes(codes)
+  start_time = time.time()
+  braid.Braid.Create(word=word, num_strands=num_strands)
+  dt = time.time() - start_time
+  print(f"Braid.Create, L={word_length}: {dt * 1e3:.2f} (ms), {dt / word_length * 1e6:.2f} (us) per character")
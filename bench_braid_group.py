@@ -0,0 +1,32 @@
+import braid_group
+import random
+import timeit
+import tracemalloc
+
+# Benchmarks for braid group words. Run as a script, e.g. `python bench_braid_group.py`.
+random.seed(0)
+num_strands = 7
+word_length = 60
+num_words = 2000
+num_calls = 20000
+
+characters = [random.choice([braid_group.Generator(i) for i in range(num_strands - 1)] +
+                            [braid_group.InverseGenerator(i) for i in range(num_strands - 1)])
+              for _ in range(word_length)]
+
+# Benchmark memory per word ---------------------------------------------------
+tracemalloc.start()
+words = [braid_group.Word(list(characters)) for _ in range(num_words)]
+current, _ = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+print(f"Memory per {word_length}-character word: {current / num_words:.1f} (bytes)")
+
+# Benchmark composition and inversion -----------------------------------------
+word = words[0]
+g2 = braid_group.Generator(2)
+compose_dt = timeit.timeit(lambda: word.Compose(g2), number=num_calls) / num_calls
+print(f"Word.Compose(character): {compose_dt * 1e6:.2f} (us)")
+compose_dt = timeit.timeit(lambda: word.Compose(word), number=num_calls) / num_calls
+print(f"Word.Compose(word): {compose_dt * 1e6:.2f} (us)")
+inverse_dt = timeit.timeit(lambda: word.Inverse(), number=num_calls) / num_calls
+print(f"Word.Inverse(): {inverse_dt * 1e6:.2f} (us)")
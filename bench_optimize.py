@@ -0,0 +1,114 @@
+import braid
+import contextlib
+import io
+import numpy as np
+import optimize
+import permutation
+import sample
+import time
+import tracemalloc
+import utils
+from scipy.optimize import approx_fprime
+
+# Benchmarks for trajectory optimization. Run as a script, e.g. `python bench_optimize.py`.
+num_agents = 5
+num_timestamps = 75
+
+# Agents start on the left of a circle and end on its right, in a scrambled order.
+angles = np.linspace(0.6 * np.pi, 1.4 * np.pi, num_agents)
+start_positions = np.stack((np.cos(angles), np.sin(angles)), axis=1)
+end_positions = -start_positions[[2, 0, 4, 1, 3]]
+start_order, end_order = permutation.start_end_permutations(start_positions, end_positions)
+goal_permutation = permutation.permutation_for_system(start_positions, end_positions)
+word = sample.sample_braids(goal_permutation, stop_after_num_matches=1, shortest_first=True)[0]
+initial_trajectories = utils.BraidToTrajectory(braid.Braid.Create(word=word, num_strands=num_agents, uniform_duration=True),
+                                             num_timestamps - 2)
+initial_trajectories = utils.AttachEndpoints(initial_trajectories,
+                                             start_positions=start_positions[start_order],
+                                             end_positions=end_positions[end_order])
+print(f"{num_agents} agents x {num_timestamps} timestamps, braid {word}")
+
+# Benchmark collision constraint Jacobians ------------------------------------
+pairs = optimize.CollisionPairs(num_agents, num_timestamps)
+x = np.array(initial_trajectories).flatten()
+collision_constraints = lambda y: optimize.CollisionConstraints(y.reshape(initial_trajectories.shape), pairs)
+start_time = time.time()
+approx_fprime(x, collision_constraints, 1e-8)
+dt = time.time() - start_time
+print(f"Finite difference collision Jacobian: {dt * 1e3:.2f} (ms)")
+num_calls = 100
+start_time = time.time()
+for _ in range(num_calls):
+  optimize.CollisionJacobian(initial_trajectories, pairs)
+dt = (time.time() - start_time) / num_calls
+print(f"Analytic collision Jacobian: {dt * 1e3:.2f} (ms)")
+
+# Benchmark optimization ------------------------------------------------------
+def objective(trajectories):
+  return np.sum(np.diff(trajectories, axis=1)**2)
+
+def benchmark(name, optimize_function):
+  start_time = time.time()
+  with contextlib.redirect_stdout(io.StringIO()):
+    trajectories = optimize_function()
+  dt = time.time() - start_time
+  min_squared_distance = optimize.CollisionConstraints(trajectories, pairs).min() + optimize.MIN_SQUARED_DISTANCE
+  # Solutions are only comparable if the agents braid the same way.
+  num_rewound = np.count_nonzero(np.abs(optimize.WindingNumbers(trajectories) - optimize.WindingNumbers(initial_trajectories)) > 0.5)
+  print(f"{name}: objective {objective(trajectories):.3f} (min squared distance {min_squared_distance:.3f}, "
+        f"{num_rewound} pairs with changed winding numbers) in {dt:.2f} (s)")
+
+benchmark("Optimize", lambda: optimize.Optimize(initial_trajectories))
+benchmark("Optimize(method='trust-constr')", lambda: optimize.Optimize(initial_trajectories, method='trust-constr'))
+benchmark("Optimize(method='augmented-lagrangian')",
+          lambda: optimize.Optimize(initial_trajectories, method='augmented-lagrangian'))
+
+# Benchmark active set collision constraints ----------------------------------
+# A grid of agents each moves one column over, starting from straight lines with a little
+# noise, so that every row of agents has to get out of each other's way.
+rows, cols, num_timestamps = 4, 5, 30
+grid = np.stack(np.meshgrid(np.arange(cols), np.arange(rows)), axis=-1).reshape(-1, 2).astype(float)
+shifted_grid = np.roll(grid.reshape(rows, cols, 2), 1, axis=1).reshape(-1, 2)
+s = np.linspace(0, 1, num_timestamps)[None, :, None]
+initial_trajectories = grid[:, None] * (1 - s) + shifted_grid[:, None] * s
+initial_trajectories[:, 1:-1] += np.random.default_rng(0).normal(scale=0.05, size=initial_trajectories[:, 1:-1].shape)
+pairs = optimize.CollisionPairs(len(grid), num_timestamps)
+print(f"{len(grid)} agents x {num_timestamps} timestamps, {len(pairs[0])} collision constraints")
+for method in ['SLSQP', 'trust-constr', 'augmented-lagrangian']:
+  benchmark(f"Optimize(method='{method}')", lambda: optimize.Optimize(initial_trajectories, method=method))
+  benchmark(f"Optimize(method='{method}', active_set=True)",
+            lambda: optimize.Optimize(initial_trajectories, method=method, active_set=True))
+
+# Benchmark coarse to fine optimization ---------------------------------------
+# The three agent crossing scenarios of `test_optimize_three_agents.py`, for every braid.
+num_agents, num_timestamps = 3, 50
+words = sample.sample_braids((1, 2, 0))
+print(f"{num_agents} agents x {num_timestamps} timestamps, {len(words)} braids")
+for name, optimize_function in [("Optimize", optimize.Optimize), ("OptimizeCoarseToFine", optimize.OptimizeCoarseToFine)]:
+  total_time, total_objective = 0, 0
+  for word in words:
+    initial_trajectories = utils.BraidToTrajectory(braid.Braid.Create(word=word, num_strands=num_agents), num_timestamps)
+    initial_trajectories = utils.AttachEndpoints(initial_trajectories,
+                                                 start_positions=[(-1.0, 0.0), (0.0, -1.0), (1.0, -1.0)],
+                                                 end_positions=[(2.0, 0.0), (0.0, 1.0), (1.0, 1.0)])
+    start_time = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+      trajectories = optimize_function(initial_trajectories)
+    total_time += time.time() - start_time
+    total_objective += objective(trajectories)
+  print(f"{name}: total objective {total_objective:.3f} in {total_time:.2f} (s)")
+
+# Benchmark augmented Lagrangian scaling --------------------------------------
+# Time and peak memory on growing grids of agents (see above), without constraint Jacobians.
+for rows, cols, num_timestamps in [(4, 5, 30), (4, 5, 60), (6, 7, 60), (8, 10, 60)]:
+  grid = np.stack(np.meshgrid(np.arange(cols), np.arange(rows)), axis=-1).reshape(-1, 2).astype(float)
+  shifted_grid = np.roll(grid.reshape(rows, cols, 2), 1, axis=1).reshape(-1, 2)
+  s = np.linspace(0, 1, num_timestamps)[None, :, None]
+  initial_trajectories = grid[:, None] * (1 - s) + shifted_grid[:, None] * s
+  initial_trajectories[:, 1:-1] += np.random.default_rng(0).normal(scale=0.05, size=initial_trajectories[:, 1:-1].shape)
+  pairs = optimize.CollisionPairs(len(grid), num_timestamps)
+  tracemalloc.start()
+  benchmark(f"{len(grid)} agents x {num_timestamps} timestamps ({len(pairs[0])} collision constraints)",
+            lambda: optimize.Optimize(initial_trajectories, method='augmented-lagrangian'))
+  print(f"  peak memory {tracemalloc.get_traced_memory()[1] / 1e6:.1f} (MB)")
+  tracemalloc.stop()
@@ -0,0 +1,34 @@
+import numpy as np
+import permutation
+import time
+
+# Benchmarks for system permutations. Run as a script, e.g. `python bench_permutation.py`.
+rng = np.random.default_rng(0)
+num_systems = 2000
+num_agents = 6
+num_directions = 16
+start_positions = rng.normal(size=(num_systems, num_agents, 2))
+end_positions = rng.normal(size=(num_systems, num_agents, 2))
+angles = np.linspace(0, np.pi, num_directions, endpoint=False)
+directions = np.stack((np.cos(angles), np.sin(angles)), axis=1)
+
+# Benchmark permutations for many systems and directions ----------------------
+start_time = time.time()
+for b in range(num_systems):
+  for direction in directions:
+    p = permutation.permutation_for_system(list(start_positions[b]), list(end_positions[b]), direction)
+    permutation.num_inversions(p)
+dt = time.time() - start_time
+print(f"permutation_for_system x {num_systems * num_directions}: {dt:.3f} (s)")
+
+start_time = time.time()
+permutations, inversions = permutation.batch_permutations_for_systems(start_positions, end_positions, directions)
+dt = time.time() - start_time
+print(f"batch_permutations_for_systems({num_systems} x {num_directions}): {dt:.3f} (s)")
+
+# Benchmark minimal inversion directions --------------------------------------
+start_time = time.time()
+for b in range(100):
+  permutation.minimal_inversion_direction(list(start_positions[b]), list(end_positions[b]))
+dt = (time.time() - start_time) / 100
+print(f"minimal_inversion_direction({num_agents} agents): {dt * 1e3:.3f} (ms)")
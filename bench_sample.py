@@ -0,0 +1,52 @@
+import catalogue
+import sample
+import time
+
+# Benchmarks for braid sampling. Run as a script, e.g. `python bench_sample.py`.
+goal_permutations = [(1, 3, 0, 4, 2), (4, 3, 2, 1, 0), (2, 5, 0, 4, 1, 3), (5, 4, 3, 2, 1, 0), (3, 6, 1, 5, 0, 4, 2)]
+stop_after_num_matches = 20000
+
+# Benchmark depth first search ------------------------------------------------
+for goal_permutation in goal_permutations:
+  start_time = time.time()
+  words = sample.sample_braids(goal_permutation, stop_after_num_matches=stop_after_num_matches)
+  dt = time.time() - start_time
+  print(f"sample_braids({goal_permutation}): {len(words)} matches in {dt:.3f} (s)")
+
+# Benchmark pruned depth first search -----------------------------------------
+for goal_permutation in goal_permutations:
+  start_time = time.time()
+  words = sample.sample_braids(goal_permutation, stop_after_num_matches=stop_after_num_matches, prune_redundant=True)
+  dt = time.time() - start_time
+  print(f"sample_braids({goal_permutation}, prune_redundant=True): {len(words)} matches in {dt:.3f} (s)")
+
+# Benchmark shortest first search ---------------------------------------------
+for goal_permutation in goal_permutations:
+  start_time = time.time()
+  words = sample.sample_braids(goal_permutation, stop_after_num_matches=stop_after_num_matches, shortest_first=True)
+  dt = time.time() - start_time
+  print(f"sample_braids({goal_permutation}, shortest_first=True): {len(words)} matches in {dt:.3f} (s)")
+
+# Benchmark catalogue lookups -------------------------------------------------
+num_strands = 5
+start_time = time.time()
+c = catalogue.Catalogue.Build(num_strands, num_matches=100)
+dt = time.time() - start_time
+print(f"Catalogue.Build({num_strands}, num_matches=100): {len(c.word_offsets) - 1} words in {dt:.3f} (s)")
+goal_permutation = goal_permutations[1]
+num_lookups = 1000
+start_time = time.time()
+for _ in range(num_lookups):
+  words = sample.sample_braids(goal_permutation, stop_after_num_matches=100, catalogue=c)
+dt = (time.time() - start_time) / num_lookups
+print(f"sample_braids({goal_permutation}, catalogue=c): {len(words)} matches in {dt * 1e6:.1f} (us)")
+
+# Benchmark parallel depth first search ---------------------------------------
+# Only search from the main module, as worker processes may re-import it.
+if __name__ == '__main__':
+  for workers in [2, 4]:
+    goal_permutation = goal_permutations[-1]
+    start_time = time.time()
+    words = sample.sample_braids(goal_permutation, stop_after_num_matches=stop_after_num_matches, workers=workers)
+    dt = time.time() - start_time
+    print(f"sample_braids({goal_permutation}, workers={workers}): {len(words)} matches in {dt:.3f} (s)")
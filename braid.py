@@ -1,35 +1,52 @@
 import braid_group
 import numpy as np
-from typing import List, Callable
-
+from typing import List
+
+# Linearly interpolate keyframes at each of the timestamps `ts`. Keyframe `times` has shape
+# (num_knots,), and `points` has shape (..., num_knots, 2), e.g. one set of keyframes per
+# strand sharing the same keyframe times. The output has shape (..., len(ts), 2).
+def _Interpolate(times: np.ndarray, points: np.ndarray, ts: np.ndarray) -> np.ndarray:
+  # Find the keyframe interval containing each timestamp, then interpolate within it.
+  k = np.clip(np.searchsorted(times, ts, side='right'), 1, len(times) - 1)
+  t0, t1 = times[k - 1], times[k]
+  dt = t1 - t0
+  alpha = np.divide(ts - t0, dt, out=np.ones_like(dt), where=dt > 0)[:, None]
+  return ((1 - alpha) * points[..., k - 1, :]) + (alpha * points[..., k, :])
+
+
+# A strand of a braid, i.e. a continuous path in the plane parameterized by time in [0, 1].
+#
+# Strands are piecewise-linear and stored as keyframes: an increasing array of `times` of
+# shape (num_knots,) spanning [0, 1], and an array of `points` of shape (num_knots, 2) with
+# the strand's position at each of those times. Positions in between keyframes are linearly
+# interpolated. All elementary strands have a keyframe at t=0.5, so that strands built from
+# the same sequence of compositions share keyframe times and can be sampled together.
 class Strand:
-  def __init__(self, f: Callable[float, np.ndarray]):
-    # Sanity check that the provided function is a valid strand. Start and end
+  def __init__(self, times: np.ndarray, points: np.ndarray):
+    times = np.asarray(times, dtype=float)
+    points = np.asarray(points, dtype=float)
+    assert times.ndim == 1 and points.shape == (len(times), 2) and len(times) >= 2
+    assert times[0] == 0.0 and times[-1] == 1.0
+
+    # Sanity check that the provided keyframes are a valid strand. Start and end
     # points' x values must be integer, y values must be zero.
-    beg, end = f(0), f(1)
+    beg, end = points[0], points[-1]
     assert (abs(beg[0] - round(beg[0])) < 1e-8) and abs(beg[1]) < 1e-8
     assert (abs(end[0] - round(end[0])) < 1e-8) and abs(end[1]) < 1e-8
-    self.f = f
+    self.times = times
+    self.points = points
 
   @staticmethod
   def Over(start_idx: int, end_idx: int):
     assert abs(start_idx - end_idx) <= 1
-    beg = np.array([start_idx, 0])
-    end = np.array([end_idx, 0])
-    return Strand(lambda t: ((1-t) * beg) + (t * end))
+    mid = 0.5 * (start_idx + end_idx)
+    return Strand([0.0, 0.5, 1.0], [[start_idx, 0], [mid, 0], [end_idx, 0]])
 
   @staticmethod
   def Under(start_idx: int, end_idx: int):
     assert abs(start_idx - end_idx) <= 1
-    beg = np.array([start_idx, 0])
-    mid = np.array([0.5 * (start_idx + end_idx), -1])
-    end = np.array([end_idx, 0])
-    def f(t: float) -> np.ndarray:
-      if t < 0.5:
-        return ((1 - 2 * t) * beg) + (t * 2 * mid)
-      else:
-        return ((1 - t) * 2 * mid) + ((2 * t - 1) * end)
-    return Strand(f)
+    mid = 0.5 * (start_idx + end_idx)
+    return Strand([0.0, 0.5, 1.0], [[start_idx, 0], [mid, -1], [end_idx, 0]])
 
   @staticmethod
   def Straight(idx: int):
@@ -53,67 +70,109 @@ class Strand:
 
   def AtTime(self, time: float) -> np.ndarray:
     assert time >= 0.0 and time <= 1.0
-    return self.f(time)
+    return self.AtTimes(np.array([time]))[0]
+
+  # Evaluate this strand at an array of timestamps, returning an array of shape (len(ts), 2).
+  def AtTimes(self, ts: np.ndarray) -> np.ndarray:
+    ts = np.asarray(ts, dtype=float)
+    assert np.all(ts >= 0.0) and np.all(ts <= 1.0)
+    return _Interpolate(self.times, self.points, ts)
 
   def Compose(self, rhs):
     # Sanity check that the two strands are composable.
-    assert np.allclose(self.f(1), rhs.f(0))
-
-    def f(time: float):
-      if time < 0.5:
-        return self.f(2 * time)
-      else:
-        return rhs.f(2 * time - 1)
+    assert np.allclose(self.points[-1], rhs.points[0])
 
-    return Strand(f)
+    # This strand is traversed in [0, 0.5], and `rhs` in [0.5, 1]. The shared keyframe
+    # at t=0.5 is only stored once.
+    times = np.concatenate([0.5 * self.times, 0.5 + 0.5 * rhs.times[1:]])
+    points = np.concatenate([self.points, rhs.points[1:]])
+    return Strand(times, points)
 
 class Braid:
-  def __init__(self, strands: List[Strand]):
+  def __init__(self, strands: List[Strand], uniform_duration: bool = False):
     assert strands
     self.strands = strands
-
+    # Whether every step of this braid takes the same amount of time.
+    self.uniform_duration = uniform_duration
+
+  # Create a braid from a word. By default, time is parameterized as if the braid were
+  # built by composing one braid per character. Composition "squishes" time, so the last
+  # step of the braid takes [0.5, 1], the step before it takes [0.25, 0.5], etc. and the
+  # earliest steps of long words take vanishingly little time. If `uniform_duration` is set,
+  # each step instead takes the same, fixed amount of time.
+  #
+  # By default each character is one step of the braid. If `layered` is set, commuting
+  # generators are packed into shared steps (see `braid_group.Word.Layers`), so the number
+  # of steps is the depth of the braid rather than the length of its word.
+  @staticmethod
+  def Create(word: braid_group.Word, num_strands: int, uniform_duration: bool = False,
+             layered: bool = False):
+    # The braid always starts with a straight step, in which no strands cross.
+    if layered:
+      steps = [[]] + braid_group.FoataLayers(word.codes)
+    else:
+      steps = [[]] + [[code] if code != 0 else [] for code in word.codes]
+
+    if uniform_duration:
+      boundaries = np.linspace(0.0, 1.0, len(steps) + 1)
+    else:
+      # The first (straight) step takes all time not taken by the characters.
+      boundaries = [0.0] + [0.5 ** (len(steps) - 1 - s) for s in range(len(steps))]
+    return Braid._FromSteps(steps, num_strands, boundaries, uniform_duration)
+
+  # Build a braid in a single pass over a list of steps. Each step is a list of character
+  # codes acting on disjoint pairs of strands, and step s spans the times
+  # [boundaries[s], boundaries[s + 1]]. Every step contributes a keyframe at its midpoint
+  # (where strands cross) and at its end, shared by all strands.
   @staticmethod
-  def Create(word: braid_group.Word, num_strands: int):
-    strands = [Strand.Straight(idx) for idx in range(num_strands)]
-    idx_to_strand = {idx : idx for idx in range(num_strands)}
-
-    for character in word.characters:
-      idxs_to_propagate = list(range(num_strands))
-      if isinstance(character, braid_group.Identity):
-        # Skip - identity element propogates each strand as it already is.
-        pass
-
-      elif isinstance(character, braid_group.Generator):
-        # Perform a swap of the two relevant strands for this generator.
-        idx = character.i
-        strands[idx_to_strand[idx + 0]] = strands[idx_to_strand[idx + 0]].Compose(Strand.OverRight(idx))
-        strands[idx_to_strand[idx + 1]] = strands[idx_to_strand[idx + 1]].Compose(Strand.UnderLeft(idx + 1))
-        idxs_to_propagate = idxs_to_propagate[:idx] + idxs_to_propagate[idx+2:]
-
-      elif isinstance(character, braid_group.InverseGenerator):
-        # Perform a swap of the two relevant strands for this generator.
-        idx = character.i
-        strands[idx_to_strand[idx + 0]] = strands[idx_to_strand[idx + 0]].Compose(Strand.UnderRight(idx))
-        strands[idx_to_strand[idx + 1]] = strands[idx_to_strand[idx + 1]].Compose(Strand.OverLeft(idx + 1))
-        idxs_to_propagate = idxs_to_propagate[:idx] + idxs_to_propagate[idx+2:]
-
-      else:
-        raise TypeError("Invalid character type")
-
-      # Propagate all other strands not touched by this character.
-      for idx in idxs_to_propagate:
-        strands[idx_to_strand[idx]] = strands[idx_to_strand[idx]].Compose(Strand.Straight(idx))
-
-      # Reindex at latest timestamp.
-      idx_to_strand = {int(strand.AtTime(1)[0]) : idx for idx, strand in enumerate(strands)}
- 
-    return Braid(strands)
+  def _FromSteps(steps: List[List[int]], num_strands: int, boundaries: List[float],
+                 uniform_duration: bool = False):
+    assert len(boundaries) == len(steps) + 1
+    boundaries = np.asarray(boundaries, dtype=float)
+    times = np.empty(2 * len(steps) + 1)
+    times[0::2] = boundaries
+    times[1::2] = 0.5 * (boundaries[:-1] + boundaries[1:])
+
+    # Track the strand currently at each index, updating it with the same swap logic as
+    # `sample.permutation_for_word`. Strands are identified by their starting index.
+    idx_to_strand = list(range(num_strands))
+    xs = np.arange(num_strands, dtype=float)
+    points = np.zeros((num_strands, len(times), 2))
+    points[:, 0, 0] = xs
+    for s, step in enumerate(steps):
+      mid, end = 2 * s + 1, 2 * s + 2
+      points[:, mid, 0] = xs
+      points[:, end, 0] = xs
+      for code in step:
+        # Perform a swap of the two relevant strands for this generator. The generator
+        # passes the left strand over the right one, and its inverse passes it under.
+        idx = abs(code) - 1
+        assert idx + 1 < num_strands
+        left, right = idx_to_strand[idx], idx_to_strand[idx + 1]
+        points[[left, right], mid, 0] = idx + 0.5
+        points[right if code > 0 else left, mid, 1] = -1
+        points[left, end, 0], points[right, end, 0] = idx + 1, idx
+        xs[left], xs[right] = idx + 1, idx
+        idx_to_strand[idx], idx_to_strand[idx + 1] = right, left
+
+    return Braid([Strand(times, points[s]) for s in range(num_strands)], uniform_duration)
 
   def Strand(self, idx: int) -> Strand:
     assert idx >= 0 and idx < len(self.strands)
     return self.strands[idx]
 
+  # Evaluate every strand at an array of timestamps, returning an array of shape
+  # (num_strands, len(ts), 2). When all strands share keyframe times (e.g. braids built
+  # with `Create`), all strands are evaluated in a single vectorized pass.
+  def Sample(self, ts: np.ndarray) -> np.ndarray:
+    ts = np.asarray(ts, dtype=float)
+    assert np.all(ts >= 0.0) and np.all(ts <= 1.0)
+    times = self.strands[0].times
+    if all(np.array_equal(s.times, times) for s in self.strands):
+      return _Interpolate(times, np.stack([s.points for s in self.strands]), ts)
+    return np.stack([s.AtTimes(ts) for s in self.strands])
+
   def Compose(self, rhs):
     # Match up the end indices of our strands with the start indices of the
     # provided braid's strands.
-    return Braid([s.Compose(rhs.Strand(s.end_idx)) for s in self.strands])
\ No newline at end of file
+    return Braid([s.Compose(rhs.Strand(int(round(s.points[-1][0])))) for s in self.strands])
\ No newline at end of file
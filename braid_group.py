@@ -1,8 +1,18 @@
 from abc import ABC, abstractmethod
-from typing import List
+from array import array
+from typing import Iterable, List, Tuple
+
+# Words are stored as a contiguous buffer of signed 8-bit character codes:
+# - The identity element is encoded as 0.
+# - The i'th generator is encoded as +(i + 1).
+# - The inverse of the i'th generator is encoded as -(i + 1).
+# This supports braids on up to 128 strands.
+CODE_TYPE = 'b'
 
 # Astract base class for an element of the braid group.
 class Element(ABC):
+  __slots__ = ()
+
   @abstractmethod
   def Inverse():
     pass
@@ -20,13 +30,35 @@ class Element(ABC):
 # - A generator element.
 # - The inverse of a generator element.
 # - The identity element.
+#
+# Characters are immutable and interned, i.e. constructing `Generator(i)` twice returns
+# the same object. This keeps words cheap to view as characters.
 class Character(Element):
-  pass
+  __slots__ = ()
+
+  # The signed integer code for this character in a word buffer.
+  @property
+  @abstractmethod
+  def code(self) -> int:
+    pass
 
 # The identity element of the braid group.
 class Identity(Character):
-  def __init__(self):
-    super().__init__()
+  __slots__ = ()
+  _instance = None
+
+  def __new__(cls):
+    if cls._instance is None:
+      cls._instance = super().__new__(cls)
+    return cls._instance
+
+  @property
+  def code(self) -> int:
+    return 0
+
+  # Copy and pickle as the interned instance.
+  def __reduce__(self):
+    return (Identity, ())
 
   def Inverse(self) -> Element:
     return Identity()
@@ -40,9 +72,24 @@ class Identity(Character):
 
 # A generator element of the braid group.
 class Generator(Character):
-  def __init__(self, i):
-    super().__init__()
-    self.i = i
+  __slots__ = ('i',)
+  _instances = {}
+
+  def __new__(cls, i):
+    instance = cls._instances.get(i)
+    if instance is None:
+      instance = super().__new__(cls)
+      instance.i = i
+      cls._instances[i] = instance
+    return instance
+
+  @property
+  def code(self) -> int:
+    return self.i + 1
+
+  # Copy and pickle as the interned instance.
+  def __reduce__(self):
+    return (Generator, (self.i,))
 
   def Inverse(self) -> Element:
     return InverseGenerator(self.i)
@@ -57,9 +104,24 @@ class Generator(Character):
 
 # The inverse of a generator element of the braid group.
 class InverseGenerator(Character):
-  def __init__(self, i):
-    super().__init__()
-    self.i = i
+  __slots__ = ('i',)
+  _instances = {}
+
+  def __new__(cls, i):
+    instance = cls._instances.get(i)
+    if instance is None:
+      instance = super().__new__(cls)
+      instance.i = i
+      cls._instances[i] = instance
+    return instance
+
+  @property
+  def code(self) -> int:
+    return -(self.i + 1)
+
+  # Copy and pickle as the interned instance.
+  def __reduce__(self):
+    return (InverseGenerator, (self.i,))
 
   def Inverse(self) -> Element:
     return Generator(self.i)
@@ -72,32 +134,267 @@ class InverseGenerator(Character):
     return "inv(g" + str(self.i) + ")"
 
 
+# Look up the (interned) character for a signed integer character code.
+def CharacterFromCode(code: int) -> Character:
+  if code > 0:
+    return Generator(code - 1)
+  if code < 0:
+    return InverseGenerator(-code - 1)
+  return Identity()
+
+
 # A word in the braid group. A word is a composed sequence of characters.
+#
+# Internally a word is a compact buffer of character codes (see `CODE_TYPE`). The
+# `characters` property provides a view of the word as a list of character objects.
 class Word(Element):
-  # Initialize from a single character or sequence of characters. Multiplication is applied 
+  __slots__ = ('codes',)
+
+  # Initialize from a single character or sequence of characters. Multiplication is applied
   # in right-to-left order, e.g. if the sequence [a, b, c, d] is passed, this word corresponds
   # to the group element a * b * c * d, where group multiplication is read right to left.
   def __init__(self, characters):
     if isinstance(characters, list):
       assert characters
-      self.characters = characters
+      self.codes = array(CODE_TYPE, [c.code for c in characters])
     else:
       if isinstance(characters, Word):
-        self.characters = characters.characters
+        self.codes = characters.codes
       else:
-        self.characters = [characters]
+        self.codes = array(CODE_TYPE, [characters.code])
+
+  # Initialize directly from a sequence of character codes, without building characters.
+  @staticmethod
+  def FromCodes(codes: Iterable[int]):
+    word = Word.__new__(Word)
+    word.codes = codes if isinstance(codes, array) else array(CODE_TYPE, codes)
+    assert word.codes
+    return word
+
+  # View of this word as a list of (interned) characters.
+  @property
+  def characters(self) -> List[Character]:
+    return [CharacterFromCode(c) for c in self.codes]
 
   # A generic group inverse reverses character order and inverts each character.
   def Inverse(self) -> Element:
-    return Word([c.Inverse() for c in reversed(self.characters)])
+    return Word.FromCodes(array(CODE_TYPE, [-c for c in reversed(self.codes)]))
 
   # Compose this word with the provided `rhs` group element.
   def Compose(self, rhs: Element) -> Element:
-    lhs_characters = self.characters
-    rhs_characters = rhs.characters if isinstance(rhs, Word) else Word(rhs).characters
-    composed_characters = lhs_characters + rhs_characters
-    return Word(composed_characters)
+    if isinstance(rhs, Word):
+      return Word.FromCodes(self.codes + rhs.codes)
+    composed_codes = array(CODE_TYPE, self.codes)
+    composed_codes.append(rhs.code)
+    return Word.FromCodes(composed_codes)
+
+  # Pack the characters of this word into layers of pairwise commuting generators, i.e. the
+  # Cartier-Foata normal form of the word under far commutativity (g_i * g_j = g_j * g_i
+  # when |i - j| >= 2). Identity characters are dropped. Composing the layers in order
+  # gives the same braid as this word.
+  def Layers(self) -> List[List[Character]]:
+    return [[CharacterFromCode(c) for c in layer] for layer in FoataLayers(self.codes)]
+
+  # Number of strands of the smallest braid group containing every character of this word.
+  def NumStrands(self) -> int:
+    return max(abs(c) for c in self.codes) + 1
+
+  # The canonical word for this braid, built from its Garside left normal form on
+  # `num_strands` strands (by default, the smallest braid group containing this word).
+  # Two words represent the same braid on `num_strands` strands if and only if their
+  # canonical words are identical.
+  def Canonical(self, num_strands: int = None) -> Element:
+    num_strands = self.NumStrands() if num_strands is None else num_strands
+    delta_power, factors = LeftNormalForm(self.codes, num_strands)
+    delta_codes = _SimpleToCodes(_Delta(num_strands))
+    codes = array(CODE_TYPE)
+    for _ in range(abs(delta_power)):
+      codes.extend(delta_codes if delta_power > 0 else [-c for c in reversed(delta_codes)])
+    for factor in factors:
+      codes.extend(_SimpleToCodes(factor))
+    return Word.FromCodes(codes) if codes else Word(Identity())
+
+  # Two words are equal if they represent the same braid. Words on different numbers of
+  # strands are compared in the larger braid group.
+  def __eq__(self, rhs) -> bool:
+    if not isinstance(rhs, Word):
+      return NotImplemented
+    if self.codes == rhs.codes:
+      return True
+    num_strands = max(self.NumStrands(), rhs.NumStrands())
+    return LeftNormalForm(self.codes, num_strands) == LeftNormalForm(rhs.codes, num_strands)
+
+  # Equal braids hash equally, regardless of the number of strands their words use.
+  def __hash__(self) -> int:
+    return hash(_BurauKey(self.codes))
 
   # Debug printing.
   def __str__(self):
-    return ' * '.join([c.__str__() for c in self.characters])
\ No newline at end of file
+    return ' * '.join([CharacterFromCode(c).__str__() for c in self.codes])
+
+
+# Compute the Cartier-Foata layers of a sequence of character codes. Each character is
+# placed in the layer after the latest layer holding a character it does not commute with,
+# i.e. one acting on an index at most one away. Characters within a layer are sorted by
+# index, and act on disjoint pairs of strands. This is linear in the word length.
+def FoataLayers(codes: Iterable[int]) -> List[List[int]]:
+  layers = []
+  last_layer = {}  # Index of the last layer holding a character acting on each index.
+  for code in codes:
+    if code == 0:
+      continue
+    i = abs(code) - 1
+    layer = 1 + max(last_layer.get(i - 1, -1), last_layer.get(i, -1), last_layer.get(i + 1, -1))
+    if layer == len(layers):
+      layers.append([])
+    layers[layer].append(code)
+    last_layer[i] = layer
+  return [sorted(layer, key=abs) for layer in layers]
+
+
+# Garside normal form ---------------------------------------------------------
+#
+# A positive braid in which every pair of strands crosses at most once is called a
+# "simple" braid. Simple braids on n strands are in one-to-one correspondence with
+# permutations of n elements, so we represent them as permutation tuples `p` where
+# p[k] is the starting index of the strand that ends at index k (the same convention
+# as `sample.permutation_for_word`). The largest simple braid, in which every pair of
+# strands crosses exactly once, is the half twist Delta.
+#
+# Every braid has a unique left normal form Delta^k * s_1 * ... * s_m, where each s_j
+# is a simple braid other than the identity and Delta, and each pair (s_j, s_j+1) is
+# left-weighted, i.e. no generator can be moved from the start of s_j+1 to the end of
+# s_j while keeping s_j simple. Computing this form is O(L^2 * n^2) in the worst case
+# for a word of length L on n strands, and typically close to linear in L.
+
+# The half twist Delta on `num_strands` strands.
+def _Delta(num_strands: int) -> Tuple[int]:
+  return tuple(reversed(range(num_strands)))
+
+
+# Conjugation by Delta, which maps the i'th generator to the (n-2-i)'th generator.
+def _Flip(simple: Tuple[int]) -> Tuple[int]:
+  n = len(simple)
+  return tuple(n - 1 - simple[n - 1 - k] for k in range(n))
+
+
+# Expand a simple braid into a positive word, as a list of character codes.
+def _SimpleToCodes(simple: Tuple[int]) -> List[int]:
+  p = list(simple)
+  codes = []
+  i = 0
+  while i < len(p) - 1:
+    if p[i] > p[i + 1]:
+      # Strands at indices i and i+1 have crossed, peel off the last generator.
+      p[i], p[i + 1] = p[i + 1], p[i]
+      codes.append(i + 1)
+      i = max(i - 1, 0)
+    else:
+      i += 1
+  return codes[::-1]
+
+
+# Make the pair of simple braids (lhs, rhs) left-weighted in place, by moving generators
+# from the start of `rhs` to the end of `lhs`. Returns whether anything was moved.
+def _LeftWeight(lhs: List[int], rhs: List[int]) -> bool:
+  n = len(lhs)
+  rhs_inverse = [0] * n
+  for k in range(n):
+    rhs_inverse[rhs[k]] = k
+
+  moved = False
+  i = 0
+  while i < n - 1:
+    # Generator i starts `rhs` if strands starting at i and i+1 cross in `rhs`, and it
+    # can be appended to `lhs` if strands ending at i and i+1 have not crossed in `lhs`.
+    if rhs_inverse[i] > rhs_inverse[i + 1] and lhs[i] < lhs[i + 1]:
+      lhs[i], lhs[i + 1] = lhs[i + 1], lhs[i]
+      a, b = rhs_inverse[i], rhs_inverse[i + 1]
+      rhs[a], rhs[b] = rhs[b], rhs[a]
+      rhs_inverse[i], rhs_inverse[i + 1] = b, a
+      moved = True
+      i = max(i - 1, 0)
+    else:
+      i += 1
+  return moved
+
+
+# Compute the left normal form of the braid given by a sequence of character codes, on
+# `num_strands` strands. Returns the power k of Delta, and the tuple of remaining simple
+# factors s_1, ..., s_m.
+def LeftNormalForm(codes: Iterable[int], num_strands: int) -> Tuple[int, Tuple[Tuple[int]]]:
+  delta = _Delta(num_strands)
+
+  # Rewrite the word as P * Delta^-r with P positive, using
+  #   inv(g_i) = (inv(g_i) * Delta) * inv(Delta)
+  # where (inv(g_i) * Delta) is simple, and x * inv(Delta) = inv(Delta) * flip(x).
+  # Simple factors are appended to the normal form of the prefix as they are produced.
+  factors = []
+  delta_power = 0
+  for code in codes:
+    if code == 0:
+      continue
+    i = abs(code) - 1
+    assert i < num_strands - 1
+    if delta_power % 2:
+      i = num_strands - 2 - i
+    if code > 0:
+      simple = list(range(num_strands))
+      simple[i], simple[i + 1] = simple[i + 1], simple[i]
+    else:
+      simple = list(delta)
+      a, b = simple.index(i), simple.index(i + 1)
+      simple[a], simple[b] = simple[b], simple[a]
+      delta_power -= 1
+    factors.append(simple)
+
+    # Restore left-weightedness from the right. Once a pair is unchanged, every pair to
+    # its left is unchanged too.
+    for j in range(len(factors) - 2, -1, -1):
+      if not _LeftWeight(factors[j], factors[j + 1]):
+        break
+
+  # Move Delta^-r to the front: P * Delta^-r = Delta^-r * flip^r(P).
+  factors = [tuple(f) for f in factors]
+  if delta_power % 2:
+    factors = [_Flip(f) for f in factors]
+
+  # Absorb leading Delta factors and drop trailing identity factors.
+  identity = tuple(range(num_strands))
+  factors = [f for f in factors if f != identity]
+  num_leading_deltas = 0
+  while num_leading_deltas < len(factors) and factors[num_leading_deltas] == delta:
+    num_leading_deltas += 1
+  return (delta_power + num_leading_deltas, tuple(factors[num_leading_deltas:]))
+
+
+# A hashable key for a braid, that is equal for equal braids even when their words use
+# different numbers of strands. This is the unreduced Burau matrix of the braid evaluated
+# at a fixed value of t modulo a prime, with trailing identity rows and columns removed.
+_BURAU_PRIME = (1 << 61) - 1
+_BURAU_T = 0x5bd1e995
+_BURAU_T_INVERSE = pow(_BURAU_T, -1, _BURAU_PRIME)
+
+def _BurauKey(codes: Iterable[int]) -> Tuple[Tuple[int]]:
+  P, t, t_inv = _BURAU_PRIME, _BURAU_T, _BURAU_T_INVERSE
+  n = max(abs(c) for c in codes) + 1
+  columns = [[int(r == c) for r in range(n)] for c in range(n)]
+  for code in codes:
+    if code == 0:
+      continue
+    i = abs(code) - 1
+    a, b = columns[i], columns[i + 1]
+    if code > 0:
+      # Right multiply by [[1-t, t], [1, 0]] acting on columns i and i+1.
+      columns[i] = [((1 - t) * x + y) % P for x, y in zip(a, b)]
+      columns[i + 1] = [(t * x) % P for x in a]
+    else:
+      # Right multiply by [[0, 1], [1/t, 1-1/t]] acting on columns i and i+1.
+      columns[i] = [(t_inv * y) % P for y in b]
+      columns[i + 1] = [(x + (1 - t_inv) * y) % P for x, y in zip(a, b)]
+
+  # Remove trailing strands that are not braided with any other strand.
+  while n > 1 and all(columns[n - 1][r] == (r == n - 1) and columns[r][n - 1] == (r == n - 1)
+                      for r in range(n)):
+    n -= 1
+  return tuple(tuple(column[:n]) for column in columns[:n])
@@ -0,0 +1,110 @@
+import braid_group
+import inspect
+import itertools
+import json
+import math
+import numpy as np
+import permutation
+import sample
+from array import array
+from typing import List, Tuple
+
+# The options of `sample.sample_braids` that determine which words a search finds, and in
+# which order, with their default values. A catalogue only answers lookups for searches
+# with the same options it was built with.
+SEARCH_OPTIONS = {name: parameter.default
+                  for name, parameter in inspect.signature(sample.sample_braids).parameters.items()
+                  if name in ('max_unsortedness_increase', 'max_revisits', 'max_depth',
+                              'prune_redundant', 'shortest_first')}
+
+# A precomputed table of braid words for every permutation of a fixed number of strands,
+# so that repeated searches for the same goal permutations become table lookups.
+#
+# For each goal permutation, the catalogue holds the first `num_matches` words found by
+# `sample.sample_braids` (or all of them, if the search found fewer). Words are stored as
+# character codes (see `braid_group.CODE_TYPE`) in one flat buffer:
+# - `codes[word_offsets[w]:word_offsets[w+1]]` are the codes of the w'th word.
+# - `words[rank_offsets[r]:rank_offsets[r+1]]` are the words for the permutation with rank
+#   `r` (see `permutation.permutation_rank`).
+# - `complete[r]` is True if the search for that permutation was exhausted, i.e. the words
+#   are all of the words the search can find.
+class Catalogue:
+  def __init__(self, num_strands: int, options: dict, rank_offsets: np.ndarray,
+               word_offsets: np.ndarray, codes: np.ndarray, complete: np.ndarray):
+    assert len(rank_offsets) == len(complete) + 1 == math.factorial(num_strands) + 1
+    assert word_offsets[-1] == len(codes)
+    self.num_strands = num_strands
+    self.options = {**SEARCH_OPTIONS, **options}
+    self.rank_offsets = rank_offsets
+    self.word_offsets = word_offsets
+    self.codes = codes
+    self.complete = complete
+
+  # Build a catalogue by searching for the first `num_matches` words of every permutation
+  # on `num_strands` strands. `options` are passed on to `sample.sample_braids`, e.g. to
+  # configure the search, or to budget the search for each permutation.
+  @staticmethod
+  def Build(num_strands: int, num_matches: int, **options):
+    rank_offsets, word_offsets, codes, complete = [0], [0], array(braid_group.CODE_TYPE), []
+    for goal_permutation in itertools.permutations(range(num_strands)):
+      stats = sample.SearchStats()
+      words = sample.sample_braids(goal_permutation, stop_after_num_matches=num_matches,
+                                   stats=stats, **options)
+      for word in words:
+        codes.extend(word.codes)
+        word_offsets.append(len(codes))
+      rank_offsets.append(len(word_offsets) - 1)
+      complete.append(stats.stop_reason == sample.StopReason.EXHAUSTED)
+
+    search_options = {name: value for name, value in options.items() if name in SEARCH_OPTIONS}
+    return Catalogue(num_strands, search_options,
+                     rank_offsets=np.array(rank_offsets, dtype=np.int64),
+                     word_offsets=np.array(word_offsets, dtype=np.int64),
+                     codes=np.frombuffer(codes.tobytes(), dtype=np.int8),
+                     complete=np.array(complete, dtype=bool))
+
+  # Save this catalogue to (or load a catalogue from) an `.npz` file.
+  def Save(self, path: str):
+    np.savez_compressed(path, num_strands=self.num_strands, options=json.dumps(self.options),
+                        rank_offsets=self.rank_offsets, word_offsets=self.word_offsets,
+                        codes=self.codes, complete=self.complete)
+
+  @staticmethod
+  def Load(path: str):
+    with np.load(path) as data:
+      return Catalogue(int(data['num_strands']), json.loads(str(data['options'])),
+                       rank_offsets=data['rank_offsets'], word_offsets=data['word_offsets'],
+                       codes=data['codes'], complete=data['complete'])
+
+  # The number of words stored for a goal permutation.
+  def NumWords(self, goal_permutation: Tuple[int]) -> int:
+    rank = permutation.permutation_rank(goal_permutation)
+    return int(self.rank_offsets[rank + 1] - self.rank_offsets[rank])
+
+  # Look up the words that `sample.sample_braids(goal_permutation, stop_after_num_matches,
+  # **options)` would return. Returns None if the catalogue cannot answer, because it was
+  # built for a different number of strands or different search options, or because it
+  # holds too few words.
+  def Lookup(self, goal_permutation: Tuple[int], stop_after_num_matches: int = -1,
+             **options) -> List[braid_group.Word]:
+    if len(goal_permutation) != self.num_strands:
+      return None
+    if {**SEARCH_OPTIONS, **options} != self.options:
+      return None
+
+    rank = permutation.permutation_rank(goal_permutation)
+    begin, end = self.rank_offsets[rank], self.rank_offsets[rank + 1]
+    if stop_after_num_matches > 0 and stop_after_num_matches <= end - begin:
+      end = begin + stop_after_num_matches
+    elif not self.complete[rank]:
+      return None
+
+    # Slice each word's codes straight out of the buffer.
+    offsets = self.word_offsets[begin:end + 1].tolist()
+    buffer = self.codes[offsets[0]:offsets[-1]].tobytes()
+    words = []
+    for lo, hi in zip(offsets[:-1], offsets[1:]):
+      codes = array(braid_group.CODE_TYPE)
+      codes.frombytes(buffer[lo - offsets[0]:hi - offsets[0]])
+      words.append(braid_group.Word.FromCodes(codes))
+    return words
@@ -1,20 +1,287 @@
+import functools
 import numpy as np
-from scipy.optimize import minimize
+import scipy.sparse
+from scipy.optimize import NonlinearConstraint, minimize
+from scipy.spatial import cKDTree
 import time
 from typing import List, Tuple
 
+# Agents are kept apart by constraining the squared distance between every pair of agents,
+# at every timestamp, to be at least this large.
+MIN_SQUARED_DISTANCE = 0.1
+
+# Index arrays (t, i, j) of the timestamp and the two agents i < j of every collision
+# constraint, ordered by timestamp, then by agent pair.
+def CollisionPairs(num_trajectories: int, num_timestamps: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+  i, j = np.triu_indices(num_trajectories, k=1)
+  t = np.repeat(np.arange(num_timestamps), len(i))
+  return t, np.tile(i, num_timestamps), np.tile(j, num_timestamps)
+
+# Index arrays (t, i, j) of the pairs of agents i < j that are within `radius` of each other
+# at timestamp t, for num_agents x num_timestamps x 2 positions, ordered as in
+# `CollisionPairs`. Nearby pairs are found with a single k-d tree over all positions, with
+# timestamps spread apart along a third axis so that only pairs at the same timestamp are
+# within the radius of each other. This takes roughly O(T * n) time and memory when agents
+# are spread out, rather than O(T * n^2).
+def NearbyCollisionPairs(positions: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+  num_trajectories, num_timestamps, _ = positions.shape
+  points = positions.transpose(1, 0, 2).reshape(-1, 2)
+  timestamps = np.repeat(np.arange(num_timestamps), num_trajectories)
+  points = np.concatenate([points, (timestamps * 4 * radius)[:, None]], axis=1)
+  neighbors = cKDTree(points).query_pairs(radius, output_type='ndarray')
+  t, i, j = neighbors[:, 0] // num_trajectories, neighbors[:, 0] % num_trajectories, neighbors[:, 1] % num_trajectories
+  i, j = np.minimum(i, j), np.maximum(i, j)
+  order = np.lexsort((j, i, t))
+  return t[order], i[order], j[order]
+
+# The union of two sets of pairs of agents (see `CollisionPairs`), for num_agents agents.
+def MergeCollisionPairs(pairs: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                        other_pairs: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                        num_trajectories: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+  keys = np.union1d(*[(t * num_trajectories + i) * num_trajectories + j for t, i, j in (pairs, other_pairs)])
+  t, ij = np.divmod(keys, num_trajectories * num_trajectories)
+  return t, ij // num_trajectories, ij % num_trajectories
+
+# The winding number of each pair of agents i < j (in the order of `np.triu_indices`), i.e.
+# the number of turns that p_j - p_i makes around the origin, for num_agents x
+# num_timestamps x 2 positions. Trajectories with the same start and end positions whose
+# agents braid the same way have the same winding numbers, as long as no pair turns by half
+# a turn or more between consecutive timestamps, and each time two agents pass through each
+# other, the winding number of that pair changes by a whole turn.
+def WindingNumbers(positions: np.ndarray) -> np.ndarray:
+  positions = np.asarray(positions, dtype=float)
+  i, j = np.triu_indices(len(positions), k=1)
+  differences = positions[j] - positions[i]
+  angles = np.arctan2(differences[..., 1], differences[..., 0])
+  turns = np.mod(np.diff(angles, axis=1) + np.pi, 2 * np.pi) - np.pi
+  return np.sum(turns, axis=1) / (2 * np.pi)
+
+# The differences p_i(t) - p_j(t) between the positions of each pair of agents (see
+# `CollisionPairs`), for num_agents x num_timestamps x 2 positions. The collision functions
+# below compute these from the positions, unless they are passed in precomputed.
+def PairDifferences(positions: np.ndarray, pairs: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> np.ndarray:
+  t, i, j = pairs
+  return positions[i, t] - positions[j, t]
+
+# Collision constraint values for num_agents x num_timestamps x 2 positions, i.e. the
+# squared distance between each pair of agents (see `CollisionPairs`) minus the minimum.
+def CollisionConstraints(positions: np.ndarray, pairs: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                         differences: np.ndarray = None) -> np.ndarray:
+  if differences is None:
+    differences = PairDifferences(positions, pairs)
+  return np.einsum('ij,ij->i', differences, differences) - MIN_SQUARED_DISTANCE
+
+# Jacobian of `CollisionConstraints` with respect to the flattened positions. Each
+# constraint only depends on the 2 + 2 coordinates of its two agents at its timestamp, with
+# derivatives 2 * (p_i - p_j) and -2 * (p_i - p_j).
+def CollisionJacobian(positions: np.ndarray, pairs: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                      differences: np.ndarray = None) -> np.ndarray:
+  t, i, j = pairs
+  num_timestamps = positions.shape[1]
+  if differences is None:
+    differences = PairDifferences(positions, pairs)
+  rows = np.arange(len(t))
+  jacobian = np.zeros((len(t), positions.size))
+  for k in range(2):
+    jacobian[rows, (i * num_timestamps + t) * 2 + k] = 2 * differences[:, k]
+    jacobian[rows, (j * num_timestamps + t) * 2 + k] = -2 * differences[:, k]
+  return jacobian
+
+# Sparse versions of the collision constraint derivatives, for solvers that support them.
+# The structure (which entries can be nonzero) only depends on the constraint pairs, so it
+# is computed once with `CollisionSparsity` and reused for every evaluation:
+# - The Jacobian has 4 entries per row, stored in CSR form with fixed column indices.
+# - The Hessian of the constraints weighted by their multipliers is a sum of constant
+#   per-constraint blocks [[2I, -2I], [-2I, 2I]] (on the coordinates of agents i and j),
+#   stored as COO row and column indices whose duplicates are summed.
+def CollisionSparsity(pairs: Tuple[np.ndarray, np.ndarray, np.ndarray], num_timestamps: int) -> Tuple[np.ndarray, ...]:
+  t, i, j = pairs
+  columns_i = (i * num_timestamps + t)[:, None] * 2 + np.arange(2)
+  columns_j = (j * num_timestamps + t)[:, None] * 2 + np.arange(2)
+  jacobian_indices = np.concatenate([columns_i, columns_j], axis=1).flatten()
+  jacobian_indptr = np.arange(0, len(jacobian_indices) + 1, 4)
+  hessian_rows = np.concatenate([columns_i, columns_j, columns_i, columns_j], axis=1).flatten()
+  hessian_columns = np.concatenate([columns_i, columns_j, columns_j, columns_i], axis=1).flatten()
+  return jacobian_indices, jacobian_indptr, hessian_rows, hessian_columns
+
+# The sparsity structure for all pairs of agents (see `CollisionPairs`), cached per problem
+# shape so that repeated optimizations of the same shape share it.
+@functools.lru_cache(maxsize=16)
+def FullCollisionSparsity(num_trajectories: int, num_timestamps: int) -> Tuple[np.ndarray, ...]:
+  sparsity = CollisionSparsity(CollisionPairs(num_trajectories, num_timestamps), num_timestamps)
+  for array in sparsity:
+    array.setflags(write=False)
+  return sparsity
+
+def SparseCollisionJacobian(positions: np.ndarray, pairs: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                            sparsity: Tuple[np.ndarray, ...], differences: np.ndarray = None) -> scipy.sparse.csr_matrix:
+  jacobian_indices, jacobian_indptr, _, _ = sparsity
+  if differences is None:
+    differences = PairDifferences(positions, pairs)
+  data = np.concatenate([2 * differences, -2 * differences], axis=1).flatten()
+  return scipy.sparse.csr_matrix((data, jacobian_indices, jacobian_indptr), shape=(len(pairs[0]), positions.size))
+
+# The gradient of the weighted sum of collision constraints, sum_k weights[k] * c_k, with
+# respect to the flattened positions, i.e. `CollisionJacobian(...).T @ weights`. This
+# scatters the derivatives of each constraint straight into the gradient, without forming a
+# Jacobian, so its cost and memory are linear in the number of pairs.
+def CollisionGradient(positions: np.ndarray, pairs: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                      weights: np.ndarray, differences: np.ndarray = None) -> np.ndarray:
+  t, i, j = pairs
+  num_trajectories, num_timestamps = positions.shape[:2]
+  if differences is None:
+    differences = PairDifferences(positions, pairs)
+  weighted_differences = 2 * weights[:, None] * differences
+  size = num_trajectories * num_timestamps
+  return np.stack([np.bincount(i * num_timestamps + t, weighted_differences[:, k], size) -
+                   np.bincount(j * num_timestamps + t, weighted_differences[:, k], size) for k in range(2)],
+                  axis=1).flatten()
+
+def SparseCollisionHessian(multipliers: np.ndarray, size: int, sparsity: Tuple[np.ndarray, ...]) -> scipy.sparse.csr_matrix:
+  _, _, hessian_rows, hessian_columns = sparsity
+  weights = 2 * multipliers[:, None] * np.array([1, 1, 1, 1, -1, -1, -1, -1])
+  return scipy.sparse.csr_matrix((weights.flatten(), (hessian_rows, hessian_columns)), shape=(size, size))
+
+# Hessian of the total squared path length objective with respect to the interior waypoints
+# of each trajectory (i.e. with fixed start and end positions), for each coordinate. Each
+# waypoint is adjacent to two others, so this is twice a tridiagonal [-1, 2, -1] matrix.
+@functools.lru_cache(maxsize=16)
+def ObjectiveHessian(num_trajectories: int, num_waypoints: int) -> scipy.sparse.csr_matrix:
+  degrees = np.full(num_waypoints, 2.0)
+  laplacian = scipy.sparse.diags([-np.ones(num_waypoints - 1), degrees, -np.ones(num_waypoints - 1)], [-1, 0, 1])
+  return scipy.sparse.csr_matrix(2 * scipy.sparse.kron(scipy.sparse.eye(num_trajectories),
+                                                       scipy.sparse.kron(laplacian, scipy.sparse.eye(2))))
+
+# The values that `Optimize` needs at one point (flattened interior waypoints), computed
+# lazily and at most once. Solvers evaluate the objective, the constraints and their
+# derivatives at the same points, so they share the reshaped positions, the differences
+# along each path, and the differences between each pair of agents.
+class _Evaluation:
+  def __init__(self, waypoints_flat: np.ndarray, cache: '_EvaluationCache'):
+    self.cache = cache
+    # Copy the point, since solvers may update it in place.
+    self.waypoints = np.array(waypoints_flat).reshape(cache.start_positions.shape[0], -1, 2)
+
+  @functools.cached_property
+  def positions(self) -> np.ndarray:
+    return np.concatenate([self.cache.start_positions, self.waypoints, self.cache.end_positions], axis=1)
+
+  @functools.cached_property
+  def diffs(self) -> np.ndarray:
+    return self.positions[:, :-1] - self.positions[:, 1:]
+
+  # The total squared path length objective, and its gradient with respect to the waypoints.
+  @functools.cached_property
+  def objective(self) -> float:
+    return np.sum(self.diffs ** 2)
+
+  @functools.cached_property
+  def objective_gradient(self) -> np.ndarray:
+    return 2 * (self.diffs[:, 1:] - self.diffs[:, :-1]).flatten()
+
+  # The collision constraints for the cache's pairs, and their derivatives.
+  @functools.cached_property
+  def pair_differences(self) -> np.ndarray:
+    return PairDifferences(self.waypoints, self.cache.pairs)
+
+  @functools.cached_property
+  def collision_constraints(self) -> np.ndarray:
+    return CollisionConstraints(self.waypoints, self.cache.pairs, self.pair_differences)
+
+  @functools.cached_property
+  def collision_jacobian(self) -> np.ndarray:
+    return CollisionJacobian(self.waypoints, self.cache.pairs, self.pair_differences)
+
+  @functools.cached_property
+  def sparse_collision_jacobian(self) -> scipy.sparse.csr_matrix:
+    return SparseCollisionJacobian(self.waypoints, self.cache.pairs, self.cache.sparsity, self.pair_differences)
+
+# A single entry cache of `_Evaluation`s, keyed on the bytes of the point. Changing the
+# collision pairs clears the cache.
+class _EvaluationCache:
+  def __init__(self, start_positions: np.ndarray, end_positions: np.ndarray):
+    self.start_positions = start_positions
+    self.end_positions = end_positions
+    self.pairs = None
+    self.sparsity = None
+    self.key = None
+    self.evaluation = None
+
+  def SetPairs(self, pairs: Tuple[np.ndarray, np.ndarray, np.ndarray], sparsity: Tuple[np.ndarray, ...] = None):
+    self.pairs = pairs
+    self.sparsity = sparsity
+    self.key = None
+    self.evaluation = None
+
+  def __call__(self, waypoints_flat: np.ndarray) -> _Evaluation:
+    key = waypoints_flat.tobytes()
+    if key != self.key:
+      self.key = key
+      self.evaluation = _Evaluation(waypoints_flat, self)
+    return self.evaluation
+
+# Pairs of agents within this distance of the minimum distance are included in the active
+# set of collision constraints (see `Optimize`).
+ACTIVE_SET_MARGIN = 0.5
+
+# The maximum number of times the problem is solved with an active set of collision constraints.
+MAX_ACTIVE_SET_ITERATIONS = 20
+
+# The augmented Lagrangian method starts from this penalty, and grows it by the given factor
+# whenever an outer iteration does not reduce the largest constraint violation enough.
+AUGMENTED_LAGRANGIAN_PENALTY = 10.0
+AUGMENTED_LAGRANGIAN_PENALTY_GROWTH = 10.0
+AUGMENTED_LAGRANGIAN_MAX_PENALTY = 1e8
+
+# The maximum number of outer (multiplier and penalty update) iterations of the augmented
+# Lagrangian method, and the largest constraint violation it accepts as a solution.
+AUGMENTED_LAGRANGIAN_MAX_ITERATIONS = 50
+AUGMENTED_LAGRANGIAN_TOLERANCE = 1e-6
+
 # Given an input set of num_agents x num_timestamps x 2 trajectories in 2D space, optimize them
 # s.t. the start/end positions remain fixed, the trajectories don't collide with one another, and
 # the trajectories each achieve their shortest path length. 
-def Optimize(trajectories: List[List[Tuple[float, float]]]) -> List[List[Tuple[float, float]]]:
-  # Store start and end positions for hard constraints.
-  start_positions = []
-  end_positions = []
+#
+# The `method` selects the solver:
+# - 'SLSQP': Sequential least squares programming, with dense constraint Jacobians. This
+#   works well for small problems, but its dense QP subproblems grow cubically with the
+#   number of variables.
+# - 'trust-constr': A trust region interior point method, with sparse constraint Jacobians
+#   and a sparse Hessian of the Lagrangian. This scales to many agents and timestamps. Its
+#   steps can pass agents through each other, so if a solve changes how the agents braid
+#   (see `WindingNumbers`), the problem is solved with 'augmented-lagrangian' instead.
+# - 'augmented-lagrangian': A first order method, which minimizes the objective plus
+#   collision penalties with L-BFGS-B, and updates the Lagrange multipliers and the penalty
+#   between solves. Each iteration costs time and memory linear in the number of collision
+#   constraints, without any constraint Jacobians, so this scales to the largest problems.
+#
+# By default every pair of agents is constrained at every timestamp. If `active_set` is
+# True, only pairs of agents within `active_set_margin` of the minimum distance of each
+# other are constrained (see `NearbyCollisionPairs`). If a solve lets a pair of agents
+# outside the active set pass through each other (see `WindingNumbers`), that pair is
+# added to the active set at every timestamp, and the problem is solved again. After each
+# solve, the active set is refreshed from the solution, and the problem is solved again
+# from there while any pair of agents collides, up to `MAX_ACTIVE_SET_ITERATIONS` times,
+# after which it is solved once with every pair of agents.
+def Optimize(trajectories: List[List[Tuple[float, float]]], method: str = 'SLSQP',
+             active_set: bool = False, active_set_margin: float = ACTIVE_SET_MARGIN) -> List[List[Tuple[float, float]]]:
+  if method not in ('SLSQP', 'trust-constr', 'augmented-lagrangian'):
+    raise ValueError(f"Unknown optimization method: {method}")
+
+  # The start and end positions are fixed, so we only optimize the interior waypoints of
+  # each trajectory, and hold the start and end positions constant.
+  trajectories = np.array(trajectories, dtype=float)
   num_trajectories = len(trajectories)
   num_timestamps = len(trajectories[0])
-  for i in range (num_trajectories):
-    start_positions.append(trajectories[i][0])
-    end_positions.append(trajectories[i][-1])
+  num_waypoints = num_timestamps - 2
+  if num_waypoints <= 0:
+    return trajectories
+  start_positions = trajectories[:, :1]
+  end_positions = trajectories[:, -1:]
+
+  # The objective, constraints and their derivatives share their work through a cache of
+  # evaluations at the last point, which is usually also the point passed to the callback.
+  evaluate = _EvaluationCache(start_positions, end_positions)
 
   # Define callback that prints optimization status.
   def print_callback(x):
@@ -26,82 +293,242 @@ def Optimize(trajectories: List[List[Tuple[float, float]]]) -> List[List[Tuple[f
       iter_dt = print_callback.curr_time - print_callback.last_time
       total_dt = print_callback.curr_time - print_callback.start_time
       print(f"Iteration {print_callback.iteration} (iter_dt={iter_dt:.2f} (s), total_dt={total_dt:.2f} (s)):")
-      print(f"  (soft) Total path length objective cost = {objective_function(x):.2f}")
-      print(f"  (hard) Collision inequality constraint costs = {collision_constraints(x)}")
-      print(f"  (hard) Start/end equality constraint costs = {start_end_constraints(x)}")
+      print(f"  (soft) Total path length objective cost = {evaluate(x).objective:.2f}")
+      print(f"  (hard) Collision inequality constraint costs = {evaluate(x).collision_constraints}")
       print("")
   print_callback.iteration = 0
   print_callback.start_time = time.time()
   print_callback.curr_time = time.time()
 
   # Define objective function: minimize total distance traveled.
-  def objective_function(positions_flat):
-    positions = positions_flat.reshape((num_trajectories, num_timestamps, 2))  # Reshape to 3D array
-    diffs = positions[:, :-1] - positions[:, 1:]
-    total_distance = np.sum(np.linalg.norm(diffs, axis=2) ** 2)
-    return total_distance
+  def objective_function(waypoints_flat):
+    return evaluate(waypoints_flat).objective
 
   # Define gradient of objective function. This just makes optimization a little faster,
   # since we won't be using finite differences.
-  def grad_objective_function(positions_flat):
-    positions = positions_flat.reshape((num_trajectories, num_timestamps, 2))  # Reshape to 3D array
-    diff = positions[:, :-1] - positions[:, 1:]
-    gradient = np.zeros_like(positions)
-    gradient[:, :-1] += 2 * diff
-    gradient[:, 1:] -= 2 * diff
-    return gradient.flatten()
+  def grad_objective_function(waypoints_flat):
+    return evaluate(waypoints_flat).objective_gradient
 
   # Define constraints: No collisions.
-  def collision_constraints(positions_flat):
-    positions = positions_flat.reshape((num_trajectories, num_timestamps, 2))  # Reshape to 3D array
-    # Reshape positions array to make it compatible for vectorized operations.
-    positions_reshaped = positions.transpose(1, 0, 2)  # Shape: (num_timestamps, num_trajectories, 2)
-    # Compute pairwise distances between all agents at all timestamps.
-    differences = positions_reshaped[:, :, None, :] - positions_reshaped[:, None, :, :]
-    distances = np.linalg.norm(differences, axis=-1)
-    # Create a mask to exclude self-distances and double-counting.
-    mask = np.triu(np.ones((num_trajectories, num_trajectories), dtype=bool), k=1)
-    # Calculate collision constraints for all timestamps.
-    constraint_values = (distances**2 - 0.1)[..., mask]
-    return np.concatenate(constraint_values)
-    
-  ''' TODO(erik): Implement (vectorized) collision constraint gradient to speed up computation...
+  def collision_constraints(waypoints_flat):
+    return evaluate(waypoints_flat).collision_constraints
+
   # Define gradient of collision constraints.
-  def grad_collision_constraints(positions_flat):
-    positions = positions_flat.reshape((num_trajectories, num_timestamps, 2))  # Reshape to 3D array
-    gradient = np.zeros_like(positions_flat)
-    for t in range(num_timestamps):
-        for i in range(num_trajectories):
-            for j in range(i+1, num_trajectories):
-                diff = positions[i, t] - positions[j, t]
-                distance = np.linalg.norm(diff)
-                if distance <= 0.1:  # If trajectories are too close, penalize them
-                    gradient[i*num_timestamps*2 + t*2 : i*num_timestamps*2 + t*2 + 2] += 2 * diff
-                    gradient[j*num_timestamps*2 + t*2 : j*num_timestamps*2 + t*2 + 2] -= 2 * diff
-    return gradient
-  '''
-
-  # Define constraints: Start and end positions.
-  def start_end_constraints(positions_flat):  
-    positions = positions_flat.reshape((num_trajectories, num_timestamps, 2))  # Reshape to 3D array
-    # Compute start and end constraints for all trajectories.
-    start_constraints = (positions[:, 0, :] - np.array(start_positions)).flatten()
-    end_constraints = (positions[:, -1, :] - np.array(end_positions)).flatten()
-    constraint_values = np.concatenate([start_constraints, end_constraints])
-    return constraint_values
-
-  # Minimize the objective function subject to constraints.
-  result = minimize(fun=objective_function, 
-                    x0=np.array(trajectories).flatten(), 
-                    jac=grad_objective_function,
-                    callback=print_callback,
-                    constraints=[
-                      {'type': 'ineq', 'fun': collision_constraints},#, 'jac': grad_collision_constraints},
-                      {'type': 'eq', 'fun': start_end_constraints}
-                    ],
-                    options={'disp': True, 'maxiter': 100},
-                    method='SLSQP')
-
-  # Reshape the optimized positions.
-  trajectories = result.x.reshape((num_trajectories, num_timestamps, 2))
-  return trajectories
\ No newline at end of file
+  def grad_collision_constraints(waypoints_flat):
+    return evaluate(waypoints_flat).collision_jacobian
+
+  def sparse_grad_collision_constraints(waypoints_flat):
+    return evaluate(waypoints_flat).sparse_collision_jacobian
+
+  # Whether the agents braid differently at `waypoints_flat` than in the initial trajectories,
+  # i.e. whether some pair of agents passed through each other (see `WindingNumbers`).
+  winding_numbers = WindingNumbers(trajectories)
+  def changes_braid(waypoints_flat):
+    return np.any(np.abs(WindingNumbers(evaluate(waypoints_flat).positions) - winding_numbers) > 0.5)
+
+  # Minimize the objective function subject to collision constraints c(x) >= 0 on the given
+  # pairs of agents with the augmented Lagrangian
+  #   f(x) + 1 / (2 * penalty) * sum(max(0, multipliers - penalty * c(x))^2 - multipliers^2),
+  # which is differentiable, and whose gradient is the objective gradient minus the collision
+  # constraint gradients weighted by max(0, multipliers - penalty * c(x)). While the penalty
+  # is small, L-BFGS-B can move agents straight through each other, so if `keep_braid` is
+  # set, solves that change how the agents braid are discarded, and the penalty is grown.
+  def augmented_lagrangian(waypoints_flat, pairs, keep_braid):
+    multipliers = np.zeros(len(pairs[0]))
+    penalty = AUGMENTED_LAGRANGIAN_PENALTY
+    violation = last_violation = np.inf
+    def lagrangian(waypoints_flat):
+      evaluation = evaluate(waypoints_flat)
+      weights = np.maximum(0, multipliers - penalty * evaluation.collision_constraints)
+      value = evaluation.objective + np.sum(weights**2 - multipliers**2) / (2 * penalty)
+      gradient = evaluation.objective_gradient - CollisionGradient(evaluation.waypoints, pairs, weights,
+                                                                   evaluation.pair_differences)
+      return value, gradient
+
+    for _ in range(AUGMENTED_LAGRANGIAN_MAX_ITERATIONS):
+      next_waypoints_flat = minimize(fun=lagrangian,
+                                     x0=waypoints_flat,
+                                     jac=True,
+                                     callback=print_callback,
+                                     options={'maxiter': 1000, 'gtol': 1e-8},
+                                     method='L-BFGS-B').x
+      if keep_braid and changes_braid(next_waypoints_flat):
+        if penalty >= AUGMENTED_LAGRANGIAN_MAX_PENALTY:
+          break
+        penalty = min(penalty * AUGMENTED_LAGRANGIAN_PENALTY_GROWTH, AUGMENTED_LAGRANGIAN_MAX_PENALTY)
+        continue
+      waypoints_flat = next_waypoints_flat
+
+      # Update the multipliers from the constraints at the solution, and grow the penalty
+      # if the constraints are not converging fast enough.
+      constraints = evaluate(waypoints_flat).collision_constraints
+      multipliers = np.maximum(0, multipliers - penalty * constraints)
+      violation = np.max(-constraints, initial=0)
+      if violation <= AUGMENTED_LAGRANGIAN_TOLERANCE:
+        break
+      if violation > 0.25 * last_violation:
+        penalty = min(penalty * AUGMENTED_LAGRANGIAN_PENALTY_GROWTH, AUGMENTED_LAGRANGIAN_MAX_PENALTY)
+      last_violation = violation
+    print(f"Augmented Lagrangian: objective {evaluate(waypoints_flat).objective:.4f}, "
+          f"constraint violation {violation:.2e}, penalty {penalty:.0e}")
+    return waypoints_flat
+
+  # Minimize the objective function from `waypoints_flat`, subject to collision constraints
+  # on the given pairs of agents. Agents at the fixed start and end positions cannot be
+  # moved apart, so we only constrain the interior waypoints.
+  def solve(waypoints_flat, pairs, keep_braid=True):
+    if method == 'SLSQP':
+      evaluate.SetPairs(pairs)
+      constraints = []
+      if len(pairs[0]):
+        constraints.append({'type': 'ineq', 'fun': collision_constraints, 'jac': grad_collision_constraints})
+      result = minimize(fun=objective_function, 
+                        x0=waypoints_flat, 
+                        jac=grad_objective_function,
+                        callback=print_callback,
+                        constraints=constraints,
+                        options={'disp': True, 'maxiter': 100},
+                        method='SLSQP')
+    elif method == 'augmented-lagrangian':
+      evaluate.SetPairs(pairs)
+      return augmented_lagrangian(waypoints_flat, pairs, keep_braid)
+    else:
+      # Use sparse gradients of the collision constraints, and the Hessian of the objective
+      # and of the constraints weighted by their Lagrange multipliers. The sparsity structure
+      # of all pairs of agents only depends on the problem shape, and is shared.
+      size = num_trajectories * num_waypoints * 2
+      if active_set:
+        sparsity = CollisionSparsity(pairs, num_waypoints)
+      else:
+        sparsity = FullCollisionSparsity(num_trajectories, num_waypoints)
+      evaluate.SetPairs(pairs, sparsity)
+      def hess_collision_constraints(waypoints_flat, multipliers):
+        return SparseCollisionHessian(multipliers, size, sparsity)
+      objective_hessian = ObjectiveHessian(num_trajectories, num_waypoints)
+
+      constraints = []
+      if len(pairs[0]):
+        constraints.append(NonlinearConstraint(collision_constraints, 0, np.inf,
+                                               jac=sparse_grad_collision_constraints,
+                                               hess=hess_collision_constraints))
+      result = minimize(fun=objective_function,
+                        x0=waypoints_flat,
+                        jac=grad_objective_function,
+                        hess=lambda waypoints_flat: objective_hessian,
+                        callback=lambda waypoints_flat, state: print_callback(waypoints_flat),
+                        constraints=constraints,
+                        options={'verbose': 1, 'maxiter': 1000, 'gtol': 1e-6, 'barrier_tol': 1e-6},
+                        method='trust-constr')
+
+      # The interior point steps grow with the trust region, and can carry agents past each
+      # other in a single step, even though every iterate is collision free. If that changes
+      # how the agents braid, solve again with the augmented Lagrangian method, which keeps
+      # the braid.
+      if keep_braid and changes_braid(result.x):
+        print("trust-constr changed the braid, solving with the augmented Lagrangian method instead.")
+        return augmented_lagrangian(waypoints_flat, pairs, keep_braid)
+    return result.x
+
+  waypoints_flat = trajectories[:, 1:-1].flatten()
+  if not active_set:
+    waypoints_flat = solve(waypoints_flat, CollisionPairs(num_trajectories, num_waypoints))
+  else:
+    # A solve only keeps the agents in the active set apart, so agents outside of it may
+    # pass through each other, which changes how the agents braid. Passing through each
+    # other changes the winding number of a pair of agents by a whole turn, so if a solve
+    # changes any winding numbers, those pairs of agents are kept apart at every timestamp
+    # from then on, and the problem is solved again. Solvers can also step agents over the
+    # constraints between them, so if that changes the winding numbers of pairs that are
+    # already kept apart, every pair of agents is kept apart, as without an active set.
+    min_distance = np.sqrt(MIN_SQUARED_DISTANCE)
+    pair_i, pair_j = np.triu_indices(num_trajectories, k=1)
+    kept_apart = np.zeros(len(pair_i), dtype=bool)
+    def active_pairs(waypoints_flat):
+      waypoints = waypoints_flat.reshape((num_trajectories, num_waypoints, 2))
+      i, j = pair_i[kept_apart], pair_j[kept_apart]
+      t = np.repeat(np.arange(num_waypoints), len(i))
+      return MergeCollisionPairs(NearbyCollisionPairs(waypoints, min_distance + active_set_margin),
+                                 (t, np.tile(i, num_waypoints), np.tile(j, num_waypoints)), num_trajectories)
+
+    for _ in range(MAX_ACTIVE_SET_ITERATIONS):
+      next_waypoints_flat = solve(waypoints_flat, active_pairs(waypoints_flat), keep_braid=np.all(kept_apart))
+      changed = np.abs(WindingNumbers(evaluate(next_waypoints_flat).positions) - winding_numbers) > 0.5
+      if np.any(changed & ~kept_apart):
+        kept_apart |= changed
+        continue
+      if np.any(changed) and not np.all(kept_apart):
+        kept_apart[:] = True
+        continue
+      waypoints_flat = next_waypoints_flat
+
+      # Stop once no pair of agents collides (up to the solver tolerance).
+      waypoints = waypoints_flat.reshape((num_trajectories, num_waypoints, 2))
+      colliding_pairs = NearbyCollisionPairs(waypoints, min_distance)
+      if not np.any(CollisionConstraints(waypoints, colliding_pairs) < -1e-6):
+        break
+    else:
+      # The iterations ran out before a collision free solution was accepted (e.g. every
+      # solve changed how the agents braid), so solve once more from the last accepted
+      # solution with every pair of agents, as without an active set.
+      print("Active set iterations ran out, solving with every pair of agents.")
+      waypoints_flat = solve(waypoints_flat, CollisionPairs(num_trajectories, num_waypoints))
+
+  # Reassemble the optimized trajectories.
+  return evaluate(waypoints_flat).positions
+
+# The fewest timestamps that `OptimizeCoarseToFine` solves the coarsest level at. Too few
+# timestamps cannot represent the crossings of the initial braid, or let agents pass
+# through each other between timestamps.
+MIN_COARSE_TIMESTAMPS = 17
+
+# Resample trajectories at `num_timestamps` evenly spaced timestamps, interpolating linearly
+# between the (evenly spaced) timestamps of the input. The start and end positions are kept.
+def ResampleTrajectories(trajectories: List[List[Tuple[float, float]]], num_timestamps: int) -> np.ndarray:
+  trajectories = np.array(trajectories, dtype=float)
+  if trajectories.shape[1] == num_timestamps or trajectories.shape[1] < 2:
+    return trajectories
+  times = np.linspace(0, 1, trajectories.shape[1])
+  new_times = np.linspace(0, 1, num_timestamps)
+  index = np.clip(np.searchsorted(times, new_times, side='right') - 1, 0, len(times) - 2)
+  weights = ((new_times - times[index]) / (times[index + 1] - times[index]))[None, :, None]
+  return (1 - weights) * trajectories[:, index] + weights * trajectories[:, index + 1]
+
+# The number of timestamps at each level of `OptimizeCoarseToFine`, from coarsest to finest.
+# Each level halves the number of intervals between timestamps of the next finer level, for
+# as long as that leaves at least `min_num_timestamps` timestamps.
+def CoarseToFineTimestamps(num_timestamps: int, min_num_timestamps: int = MIN_COARSE_TIMESTAMPS) -> List[int]:
+  levels = [num_timestamps]
+  while levels[-1] > 3 and levels[-1] // 2 + 1 >= min_num_timestamps:
+    levels.append(levels[-1] // 2 + 1)
+  return levels[::-1]
+
+# Optimize trajectories from coarse to fine resolution. The initial trajectories are
+# downsampled to a few timestamps and optimized, then the result is upsampled to the next
+# level and used to warm start its optimization, up to the full resolution. Most iterations
+# then happen on small problems, and the full resolution starts close to its solution.
+# `options` are passed on to `Optimize` at each level.
+#
+# The agents must braid the same way as in the initial trajectories, so the coarsest level
+# is the coarsest one whose downsampled trajectories keep every winding number (see
+# `WindingNumbers`), i.e. that still resolves every crossing. Optimizing a coarse level can
+# still pass agents through each other between its few timestamps, so if a level changes
+# the winding numbers, we start over from the initial trajectories at the next finer level,
+# and at worst optimize them at full resolution.
+def OptimizeCoarseToFine(trajectories: List[List[Tuple[float, float]]],
+                         min_num_timestamps: int = MIN_COARSE_TIMESTAMPS, **options) -> List[List[Tuple[float, float]]]:
+  trajectories = np.array(trajectories, dtype=float)
+  winding_numbers = WindingNumbers(trajectories)
+  def same_braid(other_trajectories):
+    return np.all(np.abs(WindingNumbers(other_trajectories) - winding_numbers) < 0.5)
+
+  levels = CoarseToFineTimestamps(trajectories.shape[1], min_num_timestamps)
+  for start in range(len(levels)):
+    if start < len(levels) - 1 and not same_braid(ResampleTrajectories(trajectories, levels[start])):
+      continue
+    optimized_trajectories = trajectories
+    for num_timestamps in levels[start:]:
+      optimized_trajectories = Optimize(ResampleTrajectories(optimized_trajectories, num_timestamps), **options)
+      if num_timestamps < trajectories.shape[1] and not same_braid(optimized_trajectories):
+        break
+    else:
+      return optimized_trajectories
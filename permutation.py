@@ -1,21 +1,31 @@
+import functools
+import math
 import numpy as np
 from typing import List, Tuple
 
 
+# Order start positions and end positions along a projection direction, returning the
+# agent indices in order of increasing projected distance. Agents that project to the same
+# distance are ordered along the perpendicular direction (rotated counterclockwise), and
+# then by index.
 def start_end_permutations(start_positions: List[np.ndarray],
                            end_positions: List[np.ndarray],
                            direction: np.ndarray = np.array([1, 0])) -> Tuple[Tuple[int], Tuple[int]]:
-  # Get distance for each start point along projection direction.
-  start_distances = [np.dot(s, direction) for s in start_positions]
-  assert len(set(start_distances)) == len(start_distances) # Ensure projected values are unique.
-  start_order = np.argsort(start_distances)
+  directions = np.asarray(direction, dtype=float).reshape(1, 2)
+  start_positions = np.asarray(start_positions, dtype=float).reshape(-1, 2)
+  end_positions = np.asarray(end_positions, dtype=float).reshape(-1, 2)
+  return (_projected_orders(start_positions, directions)[0], _projected_orders(end_positions, directions)[0])
 
-  # Get distances for each end point along projection direction.
-  end_distances = [np.dot(e, direction) for e in end_positions]
-  assert len(set(end_distances)) == len(end_distances) # Ensure projected values are unique.
-  end_order = np.argsort(end_distances)
 
-  return (start_order, end_order)
+# Order positions of shape (..., n, 2) along each of the (D, 2) directions, returning agent
+# indices of shape (..., D, n). See `start_end_permutations`.
+def _projected_orders(positions: np.ndarray, directions: np.ndarray) -> np.ndarray:
+  # Get distance for each point along the projection directions, and along their
+  # perpendiculars to break ties. `np.lexsort` sorts by the last key first, and is stable.
+  perpendiculars = np.stack((-directions[:, 1], directions[:, 0]), axis=1)
+  distances = np.swapaxes(positions @ directions.T, -1, -2)
+  perpendicular_distances = np.swapaxes(positions @ perpendiculars.T, -1, -2)
+  return np.lexsort((perpendicular_distances, distances), axis=-1)
 
 
 # Given a set of 2D start positions and 2D end positions, return the braid permutation
@@ -50,5 +60,122 @@ def permutation_for_system(start_positions: List[np.ndarray],
                            end_positions: List[np.ndarray], 
                            direction: np.ndarray = np.array([1, 0])) -> Tuple[int]:
   start_order, end_order = start_end_permutations(start_positions, end_positions, direction)
-  permutation = [end_order[start_order[i]] for i in range(len(start_positions))]
-  return tuple(permutation)
\ No newline at end of file
+  permutation = [int(end_order[start_order[i]]) for i in range(len(start_positions))]
+  return tuple(permutation)
+
+
+# The number of inversions of a permutation, i.e. pairs i < j with p[i] > p[j]. This is the
+# minimum number of generators in a braid word achieving the permutation.
+def num_inversions(p: Tuple[int]) -> int:
+  n = len(p)
+  return sum(1 for i in range(n) for j in range(i + 1, n) if p[i] > p[j])
+
+
+# Same as `num_inversions`, for an array of permutations of shape (..., n).
+def batch_num_inversions(p: np.ndarray) -> np.ndarray:
+  i, j = np.triu_indices(p.shape[-1], k=1)
+  return np.count_nonzero(p[..., i] > p[..., j], axis=-1)
+
+
+# Same as `permutation_for_system`, for a batch of B systems of shape (B, n, 2) viewed along
+# each of D directions of shape (D, 2), which default to the single direction [1, 0].
+# Returns the B x D permutations of shape (B, D, n), and their numbers of inversions of
+# shape (B, D), computed without looping over systems or directions.
+def batch_permutations_for_systems(start_positions: np.ndarray,
+                                   end_positions: np.ndarray,
+                                   directions: np.ndarray = np.array([[1, 0]])) -> Tuple[np.ndarray, np.ndarray]:
+  start_positions = np.asarray(start_positions, dtype=float)
+  end_positions = np.asarray(end_positions, dtype=float)
+  directions = np.asarray(directions, dtype=float).reshape(-1, 2)
+  assert start_positions.ndim == 3 and start_positions.shape == end_positions.shape
+  start_orders = _projected_orders(start_positions, directions)
+  end_orders = _projected_orders(end_positions, directions)
+  permutations = np.take_along_axis(end_orders, start_orders, axis=-1)
+  return permutations, batch_num_inversions(permutations)
+
+
+# Find a projection direction for `permutation_for_system` that minimizes the number of
+# inversions of the system permutation, and with it the length of braid words for the
+# system.
+#
+# The order of agents a and b along d only changes where d is perpendicular to s_a - s_b
+# (or to e_a - e_b for the end configuration), so these O(n^2) critical angles split
+# [0, 2 pi) into arcs on which the system permutation is constant. Reversing d reverses
+# both the start and end orders, which does not preserve the number of inversions of
+# `permutation_for_system`, so we consider d and -d separately, i.e. each critical angle
+# and its opposite. We evaluate the permutations at the middle of all arcs at once (see
+# `batch_permutations_for_systems`) and return the unit direction for the best one.
+# Ties prefer the widest arc, whose direction is furthest from projecting agents to the
+# same distance, then the smallest angle.
+def minimal_inversion_direction(start_positions: List[np.ndarray],
+                                end_positions: List[np.ndarray]) -> np.ndarray:
+  start_positions = np.asarray(start_positions, dtype=float).reshape(-1, 2)
+  end_positions = np.asarray(end_positions, dtype=float).reshape(-1, 2)
+
+  # Critical angles for the start and end differences of each pair, and their opposites, in
+  # [0, 2 pi). Pairs of agents at the same position never change order.
+  a, b = np.triu_indices(len(start_positions), k=1)
+  deltas = np.concatenate((start_positions[b] - start_positions[a], end_positions[b] - end_positions[a]))
+  deltas = deltas[np.any(deltas != 0, axis=1)]
+  angles = np.unique(np.mod(np.arctan2(deltas[:, 1], deltas[:, 0]) + np.pi / 2, np.pi))
+  if len(angles) == 0:
+    return np.array([1.0, 0.0])
+  angles = np.concatenate((angles, angles + np.pi))
+
+  # The arcs between consecutive critical angles. The last arc wraps around from the last
+  # critical angle to the first one (plus 2 pi).
+  arc_begins = angles
+  arc_ends = np.append(angles[1:], angles[0] + 2 * np.pi)
+  midpoints = np.mod((arc_begins + arc_ends) / 2, 2 * np.pi)
+  widths = arc_ends - arc_begins
+
+  directions = np.stack((np.cos(midpoints), np.sin(midpoints)), axis=1)
+  _, counts = batch_permutations_for_systems(start_positions[None], end_positions[None], directions)
+  return directions[np.lexsort((midpoints, -widths, counts[0]))[0]]
+
+# Permutations are ranked by their Lehmer code. The Lehmer code of a permutation p is the
+# sequence
+#
+#   L[i] = #{j > i : p[j] < p[i]}
+#
+# and its rank is sum_i L[i] * (n-1-i)!, i.e. the index of p in the lexicographic ordering
+# of all permutations of n elements. For example (0, 1, 2) has rank 0 and (2, 1, 0) has rank 5.
+# Ranks of permutations of up to 12 elements fit in a 32-bit integer, and larger ones are
+# just larger Python integers.
+_factorial = functools.lru_cache(maxsize=None)(math.factorial)
+
+def permutation_rank(p: Tuple[int]) -> int:
+  n = len(p)
+  rank = 0
+  for i in range(n):
+    smaller = sum(1 for j in range(i + 1, n) if p[j] < p[i])
+    rank += smaller * _factorial(n - 1 - i)
+  return rank
+
+
+# Inverse of `permutation_rank`, returning the permutation of `n` elements with this rank.
+def permutation_unrank(rank: int, n: int) -> Tuple[int]:
+  assert 0 <= rank < _factorial(n)
+  remaining = list(range(n))
+  p = []
+  for i in range(n):
+    smaller, rank = divmod(rank, _factorial(n - 1 - i))
+    p.append(remaining.pop(smaller))
+  return tuple(p)
+
+
+# The rank of permutation `p` (with rank `rank`) after swapping its i'th and i+1'th values.
+# Only the i'th and i+1'th Lehmer code entries change, so this is O(n).
+def adjacent_swap_rank(p: Tuple[int], rank: int, i: int) -> int:
+  n = len(p)
+  a, b = p[i], p[i + 1]
+  tail = p[i + 2:]
+  a_smaller = sum([x < a for x in tail])
+  b_smaller = sum([x < b for x in tail])
+  if a < b:
+    # L[i] = a_smaller, L[i+1] = b_smaller --> L'[i] = b_smaller + 1, L'[i+1] = a_smaller.
+    delta_i, delta_j = b_smaller + 1 - a_smaller, a_smaller - b_smaller
+  else:
+    # L[i] = a_smaller + 1, L[i+1] = b_smaller --> L'[i] = b_smaller, L'[i+1] = a_smaller.
+    delta_i, delta_j = b_smaller - a_smaller - 1, a_smaller - b_smaller
+  return rank + delta_i * _factorial(n - 1 - i) + delta_j * _factorial(n - 2 - i)
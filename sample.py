@@ -1,16 +1,15 @@
 import braid_group
-from collections import deque
-from typing import List, Tuple
-import copy
-import numpy as np
-
-# When taking a step during a search in the space of braids, that step may make our braid
-# more sorted, less sorted, or the same amount of sorted compared to a goal permutation.
-# Do not take a step if it would make our braid more unsorted than this value, compared
-# to the previous braid. Note that this value needs to be incremented by 2 to have any effect
-# because a swap on two strands can only make unsortedness decrease by 2, stay the same, or 
-# increase by 2.
-UNSORTEDNESS_THRESHOLD = 0
+import concurrent.futures
+import contextlib
+import enum
+import heapq
+import itertools
+import multiprocessing
+import permutation
+import queue
+import random
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
 
 # Helper function that computes a metric for how sorted a list is, compared to a 
 # goal configuration. Given an input list and goal list, each of the same size and
@@ -22,10 +21,43 @@ UNSORTEDNESS_THRESHOLD = 0
 #
 def unsortedness(values: Tuple[int], goal: Tuple[int]) -> int:
   assert len(values) == len(goal)
+  goal_index = goal_index_table(goal)
   total = 0
   for i in range(len(values)):
-    total += np.abs(i - goal.index(values[i]))
-  return int(total)
+    total += abs(i - goal_index[values[i]])
+  return total
+
+
+# Helper function that counts the inversions of a list compared to a goal configuration,
+# i.e. the number of pairs of values that appear in the opposite order in the goal list.
+# Each generator or inverse generator swaps one adjacent pair of strands, changing this
+# count by exactly one, so it is the minimum number of characters in a word that takes
+# `values` to `goal`.
+def inversions(values: Tuple[int], goal: Tuple[int]) -> int:
+  assert len(values) == len(goal)
+  goal_index = goal_index_table(goal)
+  total = 0
+  for i in range(len(values)):
+    for j in range(i + 1, len(values)):
+      if goal_index[values[i]] > goal_index[values[j]]:
+        total += 1
+  return total
+
+
+# Precompute the inverse of a goal permutation, i.e. the table mapping each value to its
+# index in the goal permutation (`goal.index(value)`).
+def goal_index_table(goal: Tuple[int]) -> List[int]:
+  goal_index = [0] * len(goal)
+  for i, value in enumerate(goal):
+    goal_index[value] = i
+  return goal_index
+
+
+# The change in unsortedness from swapping the i'th and i+1'th values, in O(1). Only the
+# terms of the two swapped values change.
+def unsortedness_delta(values: Tuple[int], goal_index: List[int], i: int) -> int:
+  a, b = goal_index[values[i]], goal_index[values[i+1]]
+  return abs(i - b) + abs(i + 1 - a) - abs(i - a) - abs(i + 1 - b)
 
 
 # Given a word on the braid group of `num_strands` strands, determine the permutation
@@ -46,41 +78,52 @@ def permutation_for_word(word: braid_group.Word, num_strands: int) -> Tuple[int]
   return tuple(permutation)
 
 
-# A class representing a path while depth-first-searching through braid words. The
-# path represents a sequence of generators and inverse generators composed against 
-# one another (i.e. a word in the braid group), as well as a history of all permutations
-# that have been achieved by sub-words in the past along this path.
-class Path:
-  def __init__(self, num_strands: int):
-    # We start with the identity word (e.g. at the origin in the lattice of generators),
-    # with the permutation for the identity word, i.e. the identity permutation.
-    self.num_strands = num_strands
-    self.word = braid_group.Identity()
-    self.permutations = [permutation_for_word(self.word, self.num_strands)]
-
-  def try_visit(self, character: braid_group.Character, goal_permutation: Tuple[int]) -> bool:
-    next_word = self.word.Compose(character)
-    p = permutation_for_word(next_word, self.num_strands)
-
-    # Did this step achieve our goal permutation? If so don't check anything else.
-    if p == goal_permutation:
-      self.permutations.append(p)
-      self.word = next_word
-      return True
+# A node in the depth-first search through braid words. Rather than storing its full word
+# and permutation history, a node stores the last character of its word (as a character
+# code, see `braid_group.CODE_TYPE`) and a pointer to its parent node, so that nodes share
+# their common prefixes. Words are only materialized for matches.
+#
+# A node's permutation is stored compactly as its rank (see `permutation.permutation_rank`).
+# Nodes also cache the unsortedness of their permutation with respect to the goal
+# permutation of the search. Both are updated incrementally from parent to child.
+class Node:
+  __slots__ = ('parent', 'code', 'rank', 'depth', 'unsortedness')
 
-    # Don't visit this word if we have seen a word with the same permutation before.
-    if p in self.permutations:
-      return False
+  def __init__(self, parent, code: int, rank: int, unsortedness: int = 0):
+    self.parent = parent
+    self.code = code
+    self.rank = rank
+    self.depth = 0 if parent is None else parent.depth + 1
+    self.unsortedness = unsortedness
 
-    # Don't visit this word if it is "more unsorted" than our previous state.
-    if unsortedness(p, goal_permutation) - unsortedness(self.permutations[-1], goal_permutation) > UNSORTEDNESS_THRESHOLD:
-      return False
-    
-    # Visit this word. We have not seen its permutation before.
-    self.permutations.append(p)
-    self.word = next_word
-    return True
+  # The root node of a search, i.e. the identity word with the identity permutation.
+  @staticmethod
+  def root(num_strands: int, goal: Tuple[int] = None):
+    p = tuple(range(num_strands))
+    return Node(None, 0, 0, 0 if goal is None else unsortedness(p, goal))
 
+  # The permutation induced by this node's word.
+  def permutation(self, num_strands: int) -> Tuple[int]:
+    return permutation.permutation_unrank(self.rank, num_strands)
+
+  # The node reached by moving from this node along the given character code, given this
+  # node's permutation `p` and the resulting change in unsortedness. The i'th generator
+  # flips the i'th and i+1'th strands, as in `permutation_for_word`.
+  def child(self, code: int, p: Tuple[int], unsortedness_delta: int = 0):
+    rank = permutation.adjacent_swap_rank(p, self.rank, abs(code) - 1)
+    return Node(self, code, rank, self.unsortedness + unsortedness_delta)
+
+  # Materialize the word for this node by following parent pointers to the root. The root
+  # itself is the identity word.
+  def word(self) -> braid_group.Word:
+    codes = []
+    node = self
+    while node.parent is not None:
+      codes.append(node.code)
+      node = node.parent
+    if not codes:
+      return braid_group.Word(braid_group.Identity())
+    return braid_group.Word.FromCodes(reversed(codes))
 
 
 # Takes as input a "permutation" on N index values, where each value in the input tuple
@@ -116,62 +159,582 @@ class Path:
 # and inverse generators, stopping when we encounter a braid that matches the required
 # permutation, or when subject to other early stopping conditions.
 #
-# TODO(erik): Configuration options we can add that would allow this algorithm to be
-# more flexible / tunable:
-# - Max unsortedness threshold.
-# - Max number of times of visiting same permutation (currently tolerance=0).
-# - Max search depth.
+# The search is configured with:
+# - `max_unsortedness_increase`: When taking a step during the search, that step may make
+#   our braid more sorted, less sorted, or the same amount of sorted compared to the goal
+#   permutation. Do not take a step if it would make our braid more unsorted than this
+#   value, compared to the previous braid. Note that this value needs to be incremented by
+#   2 to have any effect because a swap on two strands can only make unsortedness decrease
+#   by 2, stay the same, or increase by 2.
+# - `max_revisits`: The number of times a path may revisit a permutation it has already
+#   achieved.
+# - `max_depth`: The maximum number of characters in a word, or -1 for no limit.
+# - `prune_redundant`: Skip words that are trivially equal to other words in the search.
+#   Generators `i` and `j` commute when |i - j| >= 2, so of the two orders we only take
+#   the one with `i` before `j` when `i < j`. A generator immediately followed by its own
+#   inverse cancels, so we never take that step either. This shrinks the search tree by
+#   orders of magnitude. Every braid still has a word that is not pruned, but reordering a
+#   word changes the permutations along it, so that word may be excluded by the other
+#   options, or pass through the goal permutation early. The shortest braids (with one
+#   character per inversion, see `inversions`) are always all found.
+#
+# and is stopped early, returning the matches found so far, by:
+# - `stop_after_num_matches`: The number of matches to find, or -1 for no limit.
+# - `max_nodes`: The number of search nodes to expand, or -1 for no limit.
+# - `time_limit`: The wall-clock time to search for, in seconds, or None for no limit.
+#
+# If `stats` is provided, it is filled in with the number of nodes expanded, and the reason
+# the search stopped.
+#
+# By default the search is depth first, which finds matches quickly but in no particular
+# order of length. If `shortest_first` is True, the search is instead a best first (A*)
+# search over word length, guided by the number of inversions to the goal permutation
+# (see `inversions`), and matches are returned in nondecreasing length. The search
+# configuration restricts the words the same way in both cases, but a best first search
+# holds its whole frontier in memory.
+#
+# If a `catalogue` (see `catalogue.Catalogue`) is provided, it is consulted before searching.
+# If it holds the words this search would find, they are returned without searching (and
+# without applying the budgets), and otherwise the search runs as usual.
+#
+# If `workers` is greater than 1, the top levels of the search tree are split into subtrees
+# that are searched in parallel by a pool of `workers` processes. Matches are returned in
+# the same order as a single process search, and `iter_braids` yields them as soon as the
+# workers send them back, in chunks, without waiting for whole subtrees. The budgets are shared by all workers, so at
+# most `max_nodes` nodes are expanded in total, but which nodes are expanded within that
+# budget depends on the scheduling of the workers, so a search that runs out of nodes may
+# return fewer matches than a single process search would.
 def sample_braids(goal_permutation: Tuple[int],
-                  stop_after_num_matches: int = -1) -> List[braid_group.Word]:
+                  stop_after_num_matches: int = -1,
+                  max_unsortedness_increase: int = 0,
+                  max_revisits: int = 0,
+                  max_depth: int = -1,
+                  prune_redundant: bool = False,
+                  max_nodes: int = -1,
+                  time_limit: float = None,
+                  stats: 'SearchStats' = None,
+                  shortest_first: bool = False,
+                  catalogue: 'catalogue.Catalogue' = None,
+                  workers: int = 1) -> List[braid_group.Word]:
+  return list(iter_braids(goal_permutation, stop_after_num_matches,
+                          max_unsortedness_increase=max_unsortedness_increase,
+                          max_revisits=max_revisits,
+                          max_depth=max_depth,
+                          prune_redundant=prune_redundant,
+                          max_nodes=max_nodes,
+                          time_limit=time_limit,
+                          stats=stats,
+                          shortest_first=shortest_first,
+                          catalogue=catalogue,
+                          workers=workers))
+
+
+# Same as `sample_braids`, but lazily yields matching braid words as the search finds them.
+# The time limit counts from the first request for a word.
+def iter_braids(goal_permutation: Tuple[int],
+                stop_after_num_matches: int = -1,
+                max_unsortedness_increase: int = 0,
+                max_revisits: int = 0,
+                max_depth: int = -1,
+                prune_redundant: bool = False,
+                max_nodes: int = -1,
+                time_limit: float = None,
+                stats: 'SearchStats' = None,
+                shortest_first: bool = False,
+                catalogue: 'catalogue.Catalogue' = None,
+                workers: int = 1) -> Iterator[braid_group.Word]:
+  if shortest_first and workers > 1:
+    raise ValueError('A shortest first search cannot be run with multiple workers.')
+  stats = SearchStats() if stats is None else stats
+
+  if catalogue is not None:
+    words = catalogue.Lookup(goal_permutation, stop_after_num_matches,
+                             max_unsortedness_increase=max_unsortedness_increase,
+                             max_revisits=max_revisits,
+                             max_depth=max_depth,
+                             prune_redundant=prune_redundant,
+                             shortest_first=shortest_first)
+    if words is not None:
+      stats.stop_reason = StopReason.CATALOGUE
+      yield from words
+      return
+  deadline = None if time_limit is None else time.monotonic() + time_limit
+  search = _Search(goal_permutation,
+                   max_unsortedness_increase=max_unsortedness_increase,
+                   max_revisits=max_revisits,
+                   max_depth=max_depth,
+                   prune_redundant=prune_redundant)
 
-  num_strands = len(goal_permutation)
+  # We start with the identity word (e.g. at the origin in the lattice of generators),
+  # with the permutation for the identity word, i.e. the identity permutation.
+  root = Node.root(search.num_strands, goal_permutation)
+  if shortest_first:
+    words = (match.word() for match in search.best_first(root, stats, max_nodes=max_nodes, deadline=deadline))
+  elif workers > 1:
+    words = _parallel_depth_first(search, root, stats, workers, stop_after_num_matches,
+                                  max_nodes=max_nodes, deadline=deadline)
+  else:
+    words = (match.word() for match in search.depth_first(root, stats, max_nodes=max_nodes, deadline=deadline))
 
-  # Candidate "directions" that we can take at each time include the generators and
-  # their inverses.
-  dirs = ([braid_group.Generator(i) for i in range(num_strands - 1)] + 
-          [braid_group.InverseGenerator(i) for i in range(num_strands - 1)])
+  with contextlib.closing(words):
+    num_matches = 0
+    for word in words:
+      yield word
 
-  # Depth first search over generators and inverse generators for a word (a path) that
-  # achieves the right permutation.
-  paths = deque([Path(num_strands)])
-  matches = []
-  if paths[0].permutations[-1] == goal_permutation:
-    # Insert the identity braid if it matches the goal permutation.
-    matches.append(paths[0].word)
+      # Early termination criteria.
+      num_matches += 1
+      if stop_after_num_matches > 0 and num_matches >= stop_after_num_matches:
+        stats.stop_reason = StopReason.MATCH_LIMIT
+        return
 
-  done = False
-  while paths and not done:
-    path = paths.pop()
+
+# Reasons that a search for braid words can stop.
+class StopReason(enum.Enum):
+  # Every word allowed by the search configuration was searched.
+  EXHAUSTED = 'exhausted'
+  # The requested number of matches was found.
+  MATCH_LIMIT = 'match_limit'
+  # The node expansion budget ran out.
+  MAX_NODES = 'max_nodes'
+  # The wall-clock time budget ran out.
+  TIME_LIMIT = 'time_limit'
+  # The search was cancelled, e.g. a parallel search that already found enough matches.
+  CANCELLED = 'cancelled'
+  # The words were looked up in a catalogue instead of searched for.
+  CATALOGUE = 'catalogue'
+
+
+# Statistics about a search for braid words. The stop reason is None while the search is
+# still running.
+class SearchStats:
+  def __init__(self):
+    self.num_nodes = 0
+    self.stop_reason = None
+
+
+# Uniformly sample `k` items from an iterable (e.g. `iter_braids`) with reservoir sampling,
+# holding at most `k` items in memory at a time. If there are fewer than `k` items, all of
+# them are returned.
+def reservoir_sample(items: Iterable, k: int, rng: random.Random = None) -> List:
+  rng = random.Random() if rng is None else rng
+  reservoir = []
+  for n, item in enumerate(items):
+    if n < k:
+      reservoir.append(item)
+    else:
+      # Replace a random element with probability k / (n + 1).
+      j = rng.randrange(n + 1)
+      if j < k:
+        reservoir[j] = item
+  return reservoir
+
+
+# Filter a stream of words (e.g. `iter_braids`) down to distinct braids, keeping the first
+# word found for each braid. Words are compared as braids (see `braid_group.Word.__eq__`),
+# so that e.g. reservoir sampling the result samples distinct braids. Every distinct braid
+# seen so far is held in memory, so memory grows with the number of distinct braids in the
+# stream; use `reservoir_sample` alone when the stream is known to be free of duplicates.
+def distinct_braids(words: Iterable[braid_group.Word]) -> Iterator[braid_group.Word]:
+  seen = set()
+  for word in words:
+    if word not in seen:
+      seen.add(word)
+      yield word
+
+
+# The number of times each permutation rank is achieved by the nodes on the path from the
+# root of a search to `node`, inclusive.
+def _path_visits(node: Node) -> Dict[int, int]:
+  visits = {}
+  while node is not None:
+    visits[node.rank] = visits.get(node.rank, 0) + 1
+    node = node.parent
+  return visits
+
+
+# The state of a search for braid words that achieve a goal permutation. See `sample_braids`
+# for the configuration options.
+class _Search:
+  def __init__(self, goal_permutation: Tuple[int],
+               max_unsortedness_increase: int = 0,
+               max_revisits: int = 0,
+               max_depth: int = -1,
+               prune_redundant: bool = False):
+    self.goal_permutation = goal_permutation
+    self.max_unsortedness_increase = max_unsortedness_increase
+    self.max_revisits = max_revisits
+    self.max_depth = max_depth
+    self.prune_redundant = prune_redundant
+    self.num_strands = len(goal_permutation)
+    self.goal_index = goal_index_table(goal_permutation)
+    self.goal_rank = permutation.permutation_rank(goal_permutation)
+
+    # Candidate "directions" that we can take at each time include the generators and
+    # their inverses, as character codes.
+    self.dirs = ([i + 1 for i in range(self.num_strands - 1)] +
+                 [-(i + 1) for i in range(self.num_strands - 1)])
+
+  # Expand a node, given the number of times the path to it visited each permutation rank.
+  # Returns the children that match the goal permutation, and the remaining children to
+  # search in the order they should be pushed onto the stack.
+  def expand(self, node: Node, visited: Dict[int, int]) -> Tuple[List[Node], List[Node]]:
+    if self.max_depth >= 0 and node.depth >= self.max_depth:
+      return [], []
+    p = node.permutation(self.num_strands)
+
+    # A generator and its inverse induce the same swap, so only compute the change in
+    # unsortedness once per strand index.
+    deltas = [unsortedness_delta(p, self.goal_index, i) for i in range(self.num_strands - 1)]
 
     # Rank candidate next directions by how much more sorted they make our braid. This guides the
     # search, making it much (orders of magnitude) faster than naive dfs.
-    next_dirs = copy.deepcopy(dirs)
-    def _score_dir(d: braid_group.Character) -> int:
-      next_word = path.word.Compose(d)
-      p = permutation_for_word(next_word, num_strands)
-      next_value = unsortedness(p, goal_permutation)
-      curr_value = unsortedness(path.permutations[-1], goal_permutation)
-      return next_value - curr_value
-    next_dirs = sorted(next_dirs, key=_score_dir, reverse=True)
-
-    for d in next_dirs:
-      # Try to move along this direction.
-      new_path = copy.deepcopy(path)
-      if not new_path.try_visit(character=d, goal_permutation=goal_permutation):
+    ranked_dirs = sorted(self.dirs, key=lambda d: deltas[abs(d) - 1], reverse=True)
+
+    # The strand index of the last character of the node's word, if any.
+    last_i = abs(node.code) - 1 if node.code else None
+
+    matches, children = [], []
+    for d in ranked_dirs:
+      if self.prune_redundant and last_i is not None:
+        # Don't cancel the last character, or move it past a commuting generator that
+        # should have come first.
+        if d == -node.code or abs(d) - 1 <= last_i - 2:
+          continue
+
+      delta = deltas[abs(d) - 1]
+
+      # Check if moving in this direction got us to our goal permutation, i.e. a permutation
+      # with zero unsortedness.
+      if node.unsortedness + delta == 0:
+        matches.append(Node(node, d, self.goal_rank))
         continue
 
-      # Check if moving in this direction got us to our goal permutation.
-      if new_path.permutations[-1] == goal_permutation:
-        matches.append(new_path.word)
+      # Don't visit this word if it is "more unsorted" than our previous state.
+      if delta > self.max_unsortedness_increase:
+        continue
+
+      # Don't visit this word if we have seen words with the same permutation too many times.
+      child = node.child(d, p, delta)
+      if visited.get(child.rank, 0) > self.max_revisits:
+        continue
 
-        # Early termination criteria.
-        if stop_after_num_matches > 0 and len(matches) >= stop_after_num_matches: 
-          done = True
-          break
+      children.append(child)
+    return matches, children
 
+  # Depth first search over generators and inverse generators for words (paths) below
+  # `root` that achieve the goal permutation, yielding matching nodes in order. The search
+  # stops after expanding `max_nodes` nodes (if not -1), at the `deadline` (if not None)
+  # as measured by `time.monotonic`, or once `cancelled()` returns True (if provided, this
+  # is polled every `_CANCEL_POLL_INTERVAL` nodes), and records statistics into `stats`.
+  # A matching root is yielded when it is expanded, so only if the budgets allow it.
+  # If `reserve_nodes` is provided, the search reserves more nodes with it whenever it runs
+  # out of nodes, e.g. from a budget shared with other searches. It is called with the
+  # number of nodes to reserve, and returns the number of nodes granted.
+  def depth_first(self, root: Node, stats: SearchStats,
+                  max_nodes: int = -1, deadline: float = None,
+                  cancelled: Callable[[], bool] = None,
+                  reserve_nodes: Callable[[int], int] = None) -> Iterator[Node]:
+    # The number of times each permutation rank was achieved by the nodes on the path from
+    # the root to the node currently being expanded. This is shared by the whole search, and
+    # updated as the search descends and backtracks.
+    visited = _path_visits(root)
+
+    # Each stack entry holds a node on the current path and its children that have not
+    # been searched yet.
+    stack = [(root, None)]
+    while stack:
+      node, children = stack[-1]
+      if children is None:
+        # Expand this node, if the budget allows it.
+        if max_nodes >= 0 and stats.num_nodes >= max_nodes and reserve_nodes is not None:
+          max_nodes += reserve_nodes(_CANCEL_POLL_INTERVAL)
+        if max_nodes >= 0 and stats.num_nodes >= max_nodes:
+          stats.stop_reason = StopReason.MAX_NODES
+          return
+        if deadline is not None and time.monotonic() >= deadline:
+          stats.stop_reason = StopReason.TIME_LIMIT
+          return
+        if cancelled is not None and stats.num_nodes % _CANCEL_POLL_INTERVAL == 0 and cancelled():
+          stats.stop_reason = StopReason.CANCELLED
+          return
+        stats.num_nodes += 1
+        if node is root and root.unsortedness == 0:
+          # Insert the root if it matches the goal permutation.
+          yield root
+        matches, children = self.expand(node, visited)
+        stack[-1] = (node, children)
+        yield from matches
+
+      if not children:
+        # Backtrack.
+        stack.pop()
+        visited[node.rank] -= 1
+        if not visited[node.rank]:
+          del visited[node.rank]
         continue
-      
-      paths.append(new_path)
 
-  # Convert to words, in case any matches were a single character.
-  return [braid_group.Word(match) for match in matches]
\ No newline at end of file
+      child = children.pop()
+      visited[child.rank] = visited.get(child.rank, 0) + 1
+      stack.append((child, None))
+
+    stats.stop_reason = StopReason.EXHAUSTED
+
+  # Best first (A*) search over generators and inverse generators for words (paths) below
+  # `root` that achieve the goal permutation, yielding matching nodes in nondecreasing
+  # depth. The cost of a node is its depth, and the heuristic is its number of inversions
+  # to the goal permutation, which never overestimates the number of characters left to a
+  # match and changes by exactly one per character, so nodes are expanded in nondecreasing
+  # order of estimated total length. Ties prefer deeper nodes, then earlier ones. Budgets
+  # are handled as in `depth_first`.
+  def best_first(self, root: Node, stats: SearchStats,
+                 max_nodes: int = -1, deadline: float = None) -> Iterator[Node]:
+    root_inversions = inversions(root.permutation(self.num_strands), self.goal_permutation)
+    counter = itertools.count()
+    frontier = [(root.depth + root_inversions, root_inversions, next(counter), root)]
+    while frontier:
+      _, num_inversions, _, node = heapq.heappop(frontier)
+
+      # Matches are yielded when they leave the frontier, which guarantees that no shorter
+      # match remains. As in `depth_first`, only the root is expanded past a match, and it
+      # is only yielded once the budget allows expanding it.
+      if num_inversions == 0 and node is not root:
+        yield node
+        continue
+
+      if max_nodes >= 0 and stats.num_nodes >= max_nodes:
+        stats.stop_reason = StopReason.MAX_NODES
+        return
+      if deadline is not None and time.monotonic() >= deadline:
+        stats.stop_reason = StopReason.TIME_LIMIT
+        return
+      stats.num_nodes += 1
+      if num_inversions == 0:
+        yield root
+
+      # Nodes on different paths share no visited state, so count the visits along this
+      # node's own path.
+      matches, children = self.expand(node, _path_visits(node))
+      p = node.permutation(self.num_strands)
+      for child in matches + children:
+        # Swapping an adjacent pair of strands either creates or removes its inversion.
+        i = abs(child.code) - 1
+        child_inversions = num_inversions + (1 if self.goal_index[p[i]] < self.goal_index[p[i+1]] else -1)
+        heapq.heappush(frontier, (child.depth + child_inversions, child_inversions, next(counter), child))
+
+    stats.stop_reason = StopReason.EXHAUSTED
+
+
+# Parallel search -------------------------------------------------------------
+#
+# A depth first search yields the matches among a node's children, and then searches the
+# subtrees of its remaining children in the reverse order of `_Search.expand`. We split the
+# top of the search tree into an ordered list of matches and subtrees following that same
+# order, search the subtrees in worker processes, and concatenate their matches in order.
+
+# How many nodes a worker expands between checks for cancellation, and reserves from a
+# shared node budget at a time. Matches found since the last check are also sent back then.
+_CANCEL_POLL_INTERVAL = 256
+
+# Split the search tree below `root` until there are at least this many subtrees per worker,
+# or the splitting has reached this depth.
+_SUBTREES_PER_WORKER = 4
+_MAX_SPLIT_DEPTH = 2
+
+# Workers send matches back in chunks of at most this many words, and at most this many
+# chunks are queued per subtree, so a worker that gets ahead of the consumer waits for it.
+_MAX_CHUNK_SIZE = 64
+_MAX_QUEUED_CHUNKS = 4
+
+# How long to wait on a queue before checking for cancellation or a failed worker, in seconds.
+_QUEUE_POLL_INTERVAL = 0.1
+
+# The state shared by the worker processes of a parallel search over an ordered list of
+# items (see `_split_search`), given whether each item is a subtree:
+# - `cancel_event` is set to cancel every worker's search.
+# - `node_budget` holds the number of nodes left to expand, or is None for no limit.
+# - `match_counts[k]` is the number of matches found so far in the k'th item. A subtree's
+#   matches are only returned if fewer than `stop_after_num_matches` matches come before
+#   it, so a worker stops once the matches before its subtree and its own reach the limit.
+# - `match_queues` are the queues that workers send matches back on. Only `num_queues`
+#   subtrees are searched at a time, and each uses the queue of its slot.
+class _SharedSearchState:
+  def __init__(self, is_subtree: List[bool], max_nodes: int, num_queues: int):
+    self.cancel_event = multiprocessing.Event()
+    self.node_budget = None if max_nodes < 0 else multiprocessing.Value('q', max_nodes)
+    self.match_counts = multiprocessing.Array('q', [0 if subtree else 1 for subtree in is_subtree])
+    self.match_queues = [multiprocessing.Queue(_MAX_QUEUED_CHUNKS) for _ in range(num_queues)]
+
+  # Reserve up to `num_nodes` nodes from the budget, returning the number of nodes granted,
+  # or return unused nodes to the budget (for a negative `num_nodes`).
+  def reserve_nodes(self, num_nodes: int) -> int:
+    with self.node_budget.get_lock():
+      granted = min(num_nodes, self.node_budget.value)
+      self.node_budget.value -= granted
+    return granted
+
+  def num_matches_before(self, index: int) -> int:
+    with self.match_counts.get_lock():
+      return sum(self.match_counts[:index])
+
+  def add_match(self, index: int):
+    with self.match_counts.get_lock():
+      self.match_counts[index] += 1
+
+# Set in each worker process, to the state shared by all workers.
+_worker_state = None
+
+def _init_worker(state: _SharedSearchState):
+  global _worker_state
+  _worker_state = state
+
+
+# Search the subtree of the `index`'th item in a worker process, sending its matching words
+# in chunks of `(words, None)` on the queue of its `slot`, followed by a final chunk of
+# `(words, stats)` with its search statistics, which are also returned. Stops early without
+# a final chunk if the search is cancelled while waiting for room on the queue.
+def _search_subtree(search: _Search, root: Node, index: int, slot: int,
+                    stop_after_num_matches: int, deadline: float) -> SearchStats:
+  state = _worker_state
+  match_queue = state.match_queues[slot]
+  # Pool workers only exit once the search is over, when unread chunks can be dropped.
+  match_queue.cancel_join_thread()
+  stats = SearchStats()
+  words, num_words = [], 0
+
+  # Send the words found since the last chunk. Returns False if cancelled while waiting.
+  def send(final=False):
+    nonlocal words
+    if not words and not final:
+      return True
+    while not state.cancel_event.is_set():
+      try:
+        match_queue.put((words, stats if final else None), timeout=_QUEUE_POLL_INTERVAL)
+        words = []
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  def enough_matches():
+    return (stop_after_num_matches > 0 and
+            state.num_matches_before(index) + num_words >= stop_after_num_matches)
+  def cancelled():
+    return not send() or state.cancel_event.is_set() or enough_matches()
+
+  # Expand nodes from the shared budget, if any, keeping track of the nodes reserved.
+  max_nodes, reserve_nodes, num_reserved = -1, None, 0
+  if state.node_budget is not None:
+    def reserve_nodes(num_nodes):
+      nonlocal num_reserved
+      num_granted = state.reserve_nodes(num_nodes)
+      num_reserved += num_granted
+      return num_granted
+    max_nodes = 0
+
+  for match in search.depth_first(root, stats, max_nodes=max_nodes, deadline=deadline,
+                                  cancelled=cancelled, reserve_nodes=reserve_nodes):
+    words.append(match.word())
+    num_words += 1
+    state.add_match(index)
+    if enough_matches():
+      stats.stop_reason = StopReason.MATCH_LIMIT
+      break
+    if len(words) >= _MAX_CHUNK_SIZE and not send():
+      stats.stop_reason = StopReason.CANCELLED
+      break
+
+  # Return the nodes this search reserved but did not expand.
+  if state.node_budget is not None:
+    state.reserve_nodes(stats.num_nodes - num_reserved)
+  send(final=True)
+  return stats
+
+
+# Split the search tree below `root` into an ordered list of `(node, is_subtree)` items,
+# where each item is either a matching node or the root of a subtree to search. Splitting
+# expands at most `max_nodes` nodes (if not -1). A matching root is only listed as a match
+# once it is expanded, and is otherwise yielded by the search of its subtree.
+def _split_search(search: _Search, root: Node, stats: SearchStats,
+                  num_subtrees: int, max_nodes: int = -1) -> List[Tuple[Node, bool]]:
+  items = [(root, True)]
+  for _ in range(_MAX_SPLIT_DEPTH):
+    if sum(is_subtree for _, is_subtree in items) >= num_subtrees:
+      break
+    split_items = []
+    for node, is_subtree in items:
+      if not is_subtree or (max_nodes >= 0 and stats.num_nodes >= max_nodes):
+        split_items.append((node, is_subtree))
+        continue
+      stats.num_nodes += 1
+      if node is root and root.unsortedness == 0:
+        split_items.append((root, False))
+      matches, children = search.expand(node, _path_visits(node))
+      split_items.extend((match, False) for match in matches)
+      split_items.extend((child, True) for child in reversed(children))
+    items = split_items
+  return items
+
+
+# Receive the next chunk of `(words, stats)` sent by `_search_subtree` on `match_queue`,
+# raising the error of its `future` if the worker failed.
+def _receive_chunk(match_queue: multiprocessing.Queue,
+                   future: concurrent.futures.Future) -> Tuple[List[braid_group.Word], SearchStats]:
+  while True:
+    try:
+      return match_queue.get(timeout=_QUEUE_POLL_INTERVAL)
+    except queue.Empty:
+      if future.done() and future.exception() is not None:
+        raise future.exception()
+
+
+# Depth first search below `root` in parallel, yielding matching words in order as the
+# workers find them. At most two subtrees per worker are searched at a time, and the next
+# one is submitted once all the matches of the earliest one were yielded.
+def _parallel_depth_first(search: _Search, root: Node, stats: SearchStats, workers: int,
+                          stop_after_num_matches: int, max_nodes: int = -1,
+                          deadline: float = None) -> Iterator[braid_group.Word]:
+  items = _split_search(search, root, stats, _SUBTREES_PER_WORKER * workers, max_nodes)
+  subtree_indices = [index for index, (_, is_subtree) in enumerate(items) if is_subtree]
+  num_slots = 2 * workers
+
+  # The workers share the nodes left after splitting, and count the matches before each
+  # subtree, including the matches found while splitting.
+  state = _SharedSearchState([is_subtree for _, is_subtree in items],
+                             max_nodes if max_nodes < 0 else max_nodes - stats.num_nodes, num_slots)
+
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                              initargs=(state,)) as executor:
+    futures = []
+    def submit(k):
+      # Search the k'th subtree, if any, using the queue of slot k % num_slots.
+      if k < len(subtree_indices):
+        index = subtree_indices[k]
+        futures.append(executor.submit(_search_subtree, search, items[index][0], index, k % num_slots,
+                                       stop_after_num_matches, deadline))
+
+    try:
+      for k in range(num_slots):
+        submit(k)
+      k = 0
+      for node, is_subtree in items:
+        if not is_subtree:
+          yield node.word()
+          continue
+
+        while True:
+          words, subtree_stats = _receive_chunk(state.match_queues[k % num_slots], futures[k])
+          yield from words
+          if subtree_stats is not None:
+            break
+        stats.num_nodes += subtree_stats.num_nodes
+        if subtree_stats.stop_reason in (StopReason.MAX_NODES, StopReason.TIME_LIMIT):
+          stats.stop_reason = subtree_stats.stop_reason
+          return
+        submit(k + num_slots)
+        k += 1
+      stats.stop_reason = StopReason.EXHAUSTED
+    finally:
+      # Once we are done (e.g. enough matches were found), stop all remaining subtree searches.
+      state.cancel_event.set()
+      for future in futures:
+        future.cancel()
@@ -1,6 +1,8 @@
 import braid
 import braid_group
+import sample
 import numpy as np
+import pickle
 
 # Test basic braid group element composition and inverses ---------------------
 e1 = braid_group.Identity()
@@ -11,6 +13,56 @@ e5 = e4.Compose(e4.Inverse())
 e6 = e5.Inverse().Compose(braid_group.Generator(3))
 assert e6.__str__() == "id * g1 * inv(g2) * g2 * inv(g1) * id * g3"
 
+# Test compact word encoding --------------------------------------------------
+assert braid_group.Generator(1) is e2
+assert braid_group.InverseGenerator(2) is e3
+assert braid_group.Identity() is e1
+assert list(e4.codes) == [0, 2, -3]
+assert list(e6.codes) == [0, 2, -3, 3, -2, 0, 4]
+assert [c.__str__() for c in e6.characters] == ["id", "g1", "inv(g2)", "g2", "inv(g1)", "id", "g3"]
+assert braid_group.Word.FromCodes([1, -2]).__str__() == "g0 * inv(g1)"
+assert braid_group.Word.FromCodes([1, -2]).Inverse().__str__() == "g1 * inv(g0)"
+assert all(a is b for a, b in zip(e6.characters, e6.characters))
+
+# Test braid equality and canonical forms -------------------------------------
+g0, g1, g2 = [braid_group.Generator(i) for i in range(3)]
+i0, i1, i2 = [braid_group.InverseGenerator(i) for i in range(3)]
+identity = braid_group.Word(braid_group.Identity())
+
+# Free cancellation.
+assert braid_group.Word([g0, i0, g1]) == braid_group.Word(g1)
+assert braid_group.Word([g1, g0, i0, i1]) == identity
+assert e5 == identity
+# Far commutativity.
+assert braid_group.Word([g0, g2]) == braid_group.Word([g2, g0])
+assert braid_group.Word([g0, i2]) == braid_group.Word([i2, g0])
+# Braid relation.
+assert braid_group.Word([g0, g1, g0]) == braid_group.Word([g1, g0, g1])
+assert braid_group.Word([i0, i1, i0]) == braid_group.Word([i1, i0, i1])
+# Distinct braids.
+assert braid_group.Word(g0) != braid_group.Word(i0)
+assert braid_group.Word(g0) != braid_group.Word(g1)
+assert braid_group.Word([g0, g1]) != braid_group.Word([g1, g0])
+assert braid_group.Word([g0, g0]) != identity
+
+# The full twist is central.
+full_twist = braid_group.Word([g0, g1, g0, g1, g0, g1])
+assert full_twist.Compose(i1) == braid_group.Word(i1).Compose(full_twist)
+
+# Canonical words are unique representatives.
+assert braid_group.Word([g0, i0, g1]).Canonical().__str__() == "g1"
+assert braid_group.Word([g2, g0]).Canonical().__str__() == braid_group.Word([g0, g2]).Canonical().__str__()
+assert braid_group.Word([g1, g0, g1]).Canonical().__str__() == braid_group.Word([g0, g1, g0]).Canonical().__str__()
+assert identity.Canonical().__str__() == "id"
+assert e6.Canonical() == e6
+
+# Equal braids hash equally, so words can be deduplicated.
+assert hash(braid_group.Word([g0, i0, g1])) == hash(braid_group.Word(g1))
+assert hash(braid_group.Word([g2, i2])) == hash(identity)
+words = [braid_group.Word([g0, g2]), braid_group.Word([g2, g0]), braid_group.Word([g0, g1, i1, g2]),
+         braid_group.Word([g0, g1]), braid_group.Word([g1, g0])]
+assert len(set(words)) == 3
+
 # Test strand constructors ----------------------------------------------------
 s0 = braid.Strand.Straight(0)
 assert np.allclose(s0.AtTime(0.0), np.array([0.0, 0.0]))
@@ -52,6 +104,17 @@ assert np.allclose(s6.AtTime(0.50), np.array([2.0,  0.0]))
 assert np.allclose(s6.AtTime(0.75), np.array([2.5,  0.0]))
 assert np.allclose(s6.AtTime(1.00), np.array([3.0,  0.0]))
 
+# Composed strands are stored as keyframes, so long compositions are cheap to evaluate and
+# can be pickled.
+assert np.allclose(s6.times, [0.0, 0.25, 0.5, 0.75, 1.0])
+assert np.allclose(s6.points, [[3.0, 0.0], [2.5, -1.0], [2.0, 0.0], [2.5, 0.0], [3.0, 0.0]])
+s7 = braid.Strand.Straight(0)
+for _ in range(1000):
+  s7 = braid.Strand.Straight(0).Compose(s7.Compose(braid.Strand.Straight(0)))
+assert np.allclose(s7.AtTime(0.3), np.array([0.0, 0.0]))
+s8 = pickle.loads(pickle.dumps(s6))
+assert np.allclose(s8.AtTime(0.125), np.array([2.75, -0.5]))
+
 # Test braid construction from words ------------------------------------------
 # Construct a 3-strand braid from the identity element.
 w1 = braid_group.Word(braid_group.Identity())
@@ -124,4 +187,62 @@ assert np.allclose(b2.Strand(2).AtTime(0.2500), np.array([2.0,  0]))
 assert np.allclose(b2.Strand(2).AtTime(0.3750), np.array([1.5,  0]))
 assert np.allclose(b2.Strand(2).AtTime(0.5000), np.array([1.0,  0]))
 assert np.allclose(b2.Strand(2).AtTime(0.7500), np.array([0.5, -1]))
-assert np.allclose(b2.Strand(2).AtTime(1.0000), np.array([0.0,  0]))
\ No newline at end of file
+assert np.allclose(b2.Strand(2).AtTime(1.0000), np.array([0.0,  0]))
+
+# Test vectorized sampling ----------------------------------------------------
+ts = np.array([0.0, 0.125, 0.1875, 0.25, 0.375, 0.5, 0.75, 1.0])
+samples = b2.Sample(ts)
+assert samples.shape == (3, len(ts), 2)
+for s in range(3):
+  assert np.allclose(b2.Strand(s).AtTimes(ts), samples[s])
+  for k, t in enumerate(ts):
+    assert np.allclose(b2.Strand(s).AtTime(t), samples[s, k])
+
+# Braids whose strands do not share keyframe times are sampled strand by strand.
+b3 = braid.Braid([braid.Strand.Straight(0), braid.Strand.Straight(1).Compose(braid.Strand.Straight(1))])
+assert np.allclose(b3.Sample(ts)[1], np.tile([1.0, 0.0], (len(ts), 1)))
+
+# Test braid construction from long words -------------------------------------
+# The strand ending at each index matches the permutation induced by the word.
+codes = [(1 if k % 3 else -1) * (1 + (7 * k) % 5) for k in range(1000)]
+w4 = braid_group.Word.FromCodes(codes)
+b4 = braid.Braid.Create(word=w4, num_strands=6)
+end_idxs = [int(round(b4.Strand(s).AtTime(1)[0])) for s in range(6)]
+permutation = sample.permutation_for_word(w4, num_strands=6)
+assert all(end_idxs[permutation[idx]] == idx for idx in range(6))
+
+# Test braid construction with uniform step durations -------------------------
+# Same braid as above, but every step (including the initial straight step) takes 1/4 of the
+# total time.
+b5 = braid.Braid.Create(word=w2, num_strands=3, uniform_duration=True)
+assert b5.uniform_duration and not b2.uniform_duration
+ts = np.array([0.0, 0.25, 0.375, 0.5, 0.625, 0.75, 0.875, 1.0])
+assert np.allclose(b5.Sample(ts)[0], [[0, 0], [0, 0], [0.5, 0], [1, 0], [1.5, -1], [2, 0], [2, 0], [2, 0]])
+assert np.allclose(b5.Sample(ts)[1], [[1, 0], [1, 0], [0.5, -1], [0, 0], [0, 0], [0, 0], [0.5, 0], [1, 0]])
+assert np.allclose(b5.Sample(ts)[2], [[2, 0], [2, 0], [2, 0], [2, 0], [1.5, 0], [1, 0], [0.5, -1], [0, 0]])
+
+# Every step of a long uniform braid is resolvable, even at the start of the braid.
+b6 = braid.Braid.Create(word=w4, num_strands=6, uniform_duration=True)
+step_duration = 1 / (len(w4.codes) + 1)
+assert np.allclose(np.diff(b6.Strand(0).times), 0.5 * step_duration)
+# The first character is inv(g0), which passes strand 0 under strand 1.
+assert np.allclose(b6.Strand(0).AtTime(1.5 * step_duration), [0.5, -1])
+assert np.allclose(b6.Strand(1).AtTime(1.5 * step_duration), [0.5, 0])
+
+# Test layering of commuting generators ---------------------------------------
+g3 = braid_group.Generator(3)
+w6 = braid_group.Word([g0, g2, braid_group.Identity(), g3, i1, g0, braid_group.InverseGenerator(3)])
+layers = w6.Layers()
+assert [[c.__str__() for c in layer] for layer in layers] == [["g0", "g2"], ["inv(g1)", "g3"], ["g0", "inv(g3)"]]
+assert braid_group.Word([c for layer in layers for c in layer]) == w6
+
+# A layered braid performs commuting crossings simultaneously.
+b7 = braid.Braid.Create(word=braid_group.Word([g0, g2]), num_strands=4, uniform_duration=True, layered=True)
+assert np.allclose(b7.Strand(0).times, [0, 0.25, 0.5, 0.75, 1])
+assert np.allclose(b7.Sample([0.75])[:, 0], [[0.5, 0], [0.5, -1], [2.5, 0], [2.5, -1]])
+assert np.allclose(b7.Sample([1.0])[:, 0], [[1, 0], [0, 0], [3, 0], [2, 0]])
+
+# Layering preserves the braid's endpoints.
+b8 = braid.Braid.Create(word=w4, num_strands=6, layered=True)
+assert len(b8.Strand(0).times) < len(b4.Strand(0).times)
+assert np.allclose(b8.Sample([1.0]), b4.Sample([1.0]))
@@ -0,0 +1,56 @@
+import catalogue
+import itertools
+import os
+import sample
+import tempfile
+
+# Test building a catalogue ---------------------------------------------------
+num_matches = 10
+c = catalogue.Catalogue.Build(num_strands=4, num_matches=num_matches)
+for goal_permutation in itertools.permutations(range(4)):
+  words = sample.sample_braids(goal_permutation)
+  assert c.NumWords(goal_permutation) == min(len(words), num_matches)
+
+  # Lookups return the same words as searching.
+  for stop_after_num_matches in [1, num_matches]:
+    looked_up_words = c.Lookup(goal_permutation, stop_after_num_matches)
+    assert [str(w) for w in looked_up_words] == [str(w) for w in words[:stop_after_num_matches]]
+
+  # Lookups for all words, or more than the catalogue holds, only succeed if the catalogue
+  # holds every word.
+  looked_up_words = c.Lookup(goal_permutation)
+  if len(words) < num_matches:
+    assert [str(w) for w in looked_up_words] == [str(w) for w in words]
+  elif len(words) > num_matches:
+    assert looked_up_words is None
+    assert c.Lookup(goal_permutation, num_matches + 1) is None
+
+# Lookups with different search options or numbers of strands miss.
+assert c.Lookup((2, 0, 3, 1), 1, max_revisits=1) is None
+assert c.Lookup((1, 2, 0), 1) is None
+assert c.Lookup((2, 0, 3, 1), 1, max_revisits=0) is not None
+
+# Test saving and loading a catalogue -----------------------------------------
+c = catalogue.Catalogue.Build(num_strands=3, num_matches=5, max_revisits=1, max_depth=6)
+with tempfile.TemporaryDirectory() as directory:
+  path = os.path.join(directory, 'catalogue.npz')
+  c.Save(path)
+  loaded = catalogue.Catalogue.Load(path)
+assert loaded.options == c.options
+for goal_permutation in itertools.permutations(range(3)):
+  assert ([str(w) for w in loaded.Lookup(goal_permutation, 5, max_revisits=1, max_depth=6)] ==
+          [str(w) for w in c.Lookup(goal_permutation, 5, max_revisits=1, max_depth=6)])
+
+# Test sampling braids with a catalogue ---------------------------------------
+stats = sample.SearchStats()
+words = sample.sample_braids((1, 2, 0), stop_after_num_matches=3, max_revisits=1, max_depth=6,
+                             catalogue=loaded, stats=stats)
+assert stats.stop_reason == sample.StopReason.CATALOGUE and stats.num_nodes == 0
+assert ([str(w) for w in words] ==
+        [str(w) for w in sample.sample_braids((1, 2, 0), stop_after_num_matches=3, max_revisits=1, max_depth=6)])
+
+# Cache misses fall back to searching.
+stats = sample.SearchStats()
+words = sample.sample_braids((1, 2, 0), stop_after_num_matches=3, catalogue=loaded, stats=stats)
+assert stats.stop_reason == sample.StopReason.MATCH_LIMIT and stats.num_nodes > 0
+assert [str(w) for w in words] == [str(w) for w in sample.sample_braids((1, 2, 0), stop_after_num_matches=3)]
@@ -15,19 +15,12 @@ initial_trajectories = utils.BraidToTrajectory(braid, num_timestamps)
 
 # Connect start locations to work space. X positions ordered as 0, 1, 2, 3.
 # Y positions can be arbitrary.
-initial_trajectories[0].insert(0, (-1.4, -0.5))
-initial_trajectories[1].insert(0, (-0.6, 0.8))
-initial_trajectories[2].insert(0, (1.2, 0.3))
-initial_trajectories[3].insert(0, (1.4, -0.5))
-num_timestamps += 1
-
 # Connect end locations to work space. X positions ordered as 3, 1, 2, 0 (the permutation induced by the braid we are using).
 # Y positions can be arbitrary.
-initial_trajectories[0].append((0.7, 0.6))
-initial_trajectories[1].append((0.0, -1.0))
-initial_trajectories[2].append((0.5, 0.0))
-initial_trajectories[3].append((-0.4, -0.5))
-num_timestamps += 1
+initial_trajectories = utils.AttachEndpoints(initial_trajectories,
+                                             start_positions=[(-1.4, -0.5), (-0.6, 0.8), (1.2, 0.3), (1.4, -0.5)],
+                                             end_positions=[(0.7, 0.6), (0.0, -1.0), (0.5, 0.0), (-0.4, -0.5)])
+num_timestamps += 2
 
 optimized_trajectories = optimize.Optimize(initial_trajectories)
 
@@ -0,0 +1,207 @@
+import braid
+import braid_group
+import contextlib
+import io
+import itertools
+import numpy as np
+import optimize
+import utils
+from scipy.optimize import approx_fprime
+
+# Test collision constraints ---------------------------------------------------
+rng = np.random.default_rng(0)
+num_trajectories, num_timestamps = 4, 6
+positions = rng.normal(size=(num_trajectories, num_timestamps, 2))
+pairs = optimize.CollisionPairs(num_trajectories, num_timestamps)
+assert len(pairs[0]) == num_timestamps * num_trajectories * (num_trajectories - 1) // 2
+
+# Constraints are ordered by timestamp, then by agent pair.
+constraints = optimize.CollisionConstraints(positions, pairs)
+expected_constraints = [np.sum((positions[i, t] - positions[j, t])**2) - optimize.MIN_SQUARED_DISTANCE
+                        for t in range(num_timestamps)
+                        for i in range(num_trajectories)
+                        for j in range(i + 1, num_trajectories)]
+assert np.allclose(constraints, expected_constraints)
+
+# The analytic Jacobian matches finite differences.
+def check_jacobian(function, jacobian, x):
+  numeric_jacobian = np.array([approx_fprime(x, lambda y: function(y)[k], 1e-7) for k in range(len(function(x)))])
+  assert np.allclose(jacobian(x), numeric_jacobian, atol=1e-5)
+
+flat_positions = positions.flatten()
+check_jacobian(lambda x: optimize.CollisionConstraints(x.reshape(positions.shape), pairs),
+               lambda x: optimize.CollisionJacobian(x.reshape(positions.shape), pairs),
+               flat_positions)
+
+# Weighted collision gradients match the transposed Jacobian, also for subsets of pairs.
+weights = rng.normal(size=len(pairs[0]))
+assert np.allclose(optimize.CollisionGradient(positions, pairs, weights),
+                   optimize.CollisionJacobian(positions, pairs).T @ weights)
+subset = tuple(index[::3] for index in pairs)
+assert np.allclose(optimize.CollisionGradient(positions, subset, weights[::3]),
+                   optimize.CollisionJacobian(positions, subset).T @ weights[::3])
+
+# Test nearby collision pairs -------------------------------------------------
+for radius in [0.5, 1.0, 10.0]:
+  nearby_pairs = optimize.NearbyCollisionPairs(positions, radius)
+  distances = np.sqrt(optimize.CollisionConstraints(positions, pairs) + optimize.MIN_SQUARED_DISTANCE)
+  expected_pairs = tuple(index[distances < radius] for index in pairs)
+  assert all(np.array_equal(a, b) for a, b in zip(nearby_pairs, expected_pairs))
+assert all(len(index) == 0 for index in optimize.NearbyCollisionPairs(positions, 1e-3))
+
+# Merging pairs gives their union, ordered as in `CollisionPairs`.
+merged_pairs = optimize.MergeCollisionPairs(optimize.NearbyCollisionPairs(positions, 0.5),
+                                            optimize.NearbyCollisionPairs(positions, 1.0), num_trajectories)
+assert all(np.array_equal(a, b) for a, b in zip(merged_pairs, optimize.NearbyCollisionPairs(positions, 1.0)))
+
+# Test winding numbers --------------------------------------------------------
+# Agent 1 circles agent 0 once counterclockwise, while agent 2 stays put at a distance.
+angles = np.linspace(0, 2 * np.pi, 17)
+circling_trajectories = np.zeros((3, len(angles), 2))
+circling_trajectories[1] = np.stack((np.cos(angles), np.sin(angles)), axis=1)
+circling_trajectories[2] = [5, 0]
+assert np.allclose(optimize.WindingNumbers(circling_trajectories), [1, 0, 0], atol=0.1)
+assert np.allclose(optimize.WindingNumbers(circling_trajectories[:, ::-1]), [-1, 0, 0], atol=0.1)
+
+# Test sparse derivatives -----------------------------------------------------
+sparsity = optimize.FullCollisionSparsity(num_trajectories, num_timestamps)
+assert sparsity is optimize.FullCollisionSparsity(num_trajectories, num_timestamps)
+sparse_jacobian = optimize.SparseCollisionJacobian(positions, pairs, sparsity)
+assert np.allclose(sparse_jacobian.toarray(), optimize.CollisionJacobian(positions, pairs))
+
+# The weighted constraint Hessian is the Jacobian of the weighted constraint gradient.
+multipliers = rng.uniform(size=len(pairs[0]))
+hessian = optimize.SparseCollisionHessian(multipliers, positions.size, sparsity)
+check_jacobian(lambda x: multipliers @ optimize.CollisionJacobian(x.reshape(positions.shape), pairs),
+               lambda x: hessian.toarray(),
+               flat_positions)
+
+# The objective Hessian is the Jacobian of the objective gradient with respect to the
+# interior waypoints, holding the start and end positions fixed.
+def objective_gradient(x):
+  full_positions = positions.copy()
+  full_positions[:, 1:-1] = x.reshape((num_trajectories, num_timestamps - 2, 2))
+  diff = np.diff(full_positions, axis=1)
+  gradient = np.zeros(positions.shape)
+  gradient[:, :-1] -= 2 * diff
+  gradient[:, 1:] += 2 * diff
+  return gradient[:, 1:-1].flatten()
+check_jacobian(objective_gradient,
+               lambda x: optimize.ObjectiveHessian(num_trajectories, num_timestamps - 2).toarray(),
+               positions[:, 1:-1].flatten())
+
+# Test evaluation cache -------------------------------------------------------
+# Cached evaluations match the module's functions, and are shared until the point changes.
+evaluate = optimize._EvaluationCache(positions[:, :1], positions[:, -1:])
+interior_pairs = optimize.CollisionPairs(num_trajectories, num_timestamps - 2)
+evaluate.SetPairs(interior_pairs, optimize.FullCollisionSparsity(num_trajectories, num_timestamps - 2))
+x = positions[:, 1:-1].flatten()
+evaluation = evaluate(x)
+assert np.array_equal(evaluation.positions, positions)
+assert np.isclose(evaluation.objective, np.sum(np.diff(positions, axis=1)**2))
+assert np.allclose(evaluation.objective_gradient, objective_gradient(x))
+assert np.allclose(evaluation.collision_constraints, optimize.CollisionConstraints(positions[:, 1:-1], interior_pairs))
+assert np.allclose(evaluation.collision_jacobian, optimize.CollisionJacobian(positions[:, 1:-1], interior_pairs))
+assert np.allclose(evaluation.sparse_collision_jacobian.toarray(), evaluation.collision_jacobian)
+assert evaluate(x.copy()) is evaluation
+
+# Updating the point in place, or changing the pairs, invalidates the cache.
+x[0] += 1
+assert evaluate(x) is not evaluation and evaluate(x) is evaluate(x)
+assert evaluate(x).waypoints[0, 0, 0] == x[0]
+evaluation = evaluate(x)
+evaluate.SetPairs(optimize.NearbyCollisionPairs(positions[:, 1:-1], 1.0))
+assert evaluate(x) is not evaluation
+assert len(evaluate(x).collision_constraints) == len(evaluate.pairs[0])
+
+# Test optimization methods ---------------------------------------------------
+# Two agents swap places along a line, and must step around each other.
+num_timestamps = 9
+trajectories = np.zeros((2, num_timestamps, 2))
+trajectories[0, :, 0] = np.linspace(-1, 1, num_timestamps)
+trajectories[1, :, 0] = np.linspace(1, -1, num_timestamps)
+trajectories[0, 1:-1, 1] = 0.5
+trajectories[1, 1:-1, 1] = -0.5
+pairs = optimize.CollisionPairs(2, num_timestamps - 2)
+with contextlib.redirect_stdout(io.StringIO()):
+  for method, active_set in itertools.product(['SLSQP', 'trust-constr', 'augmented-lagrangian'], [False, True]):
+    optimized_trajectories = optimize.Optimize(trajectories, method=method, active_set=active_set)
+    assert optimized_trajectories.shape == trajectories.shape
+    assert np.array_equal(optimized_trajectories[:, [0, -1]], trajectories[:, [0, -1]])
+    assert np.all(optimize.CollisionConstraints(optimized_trajectories[:, 1:-1], pairs) > -1e-6)
+    assert np.sum(np.diff(optimized_trajectories, axis=1)**2) < np.sum(np.diff(trajectories, axis=1)**2)
+
+# Agent 0 passes over agent 1 along a wide arc, starting too far away for an active set.
+# Straightening the arc would pass under agent 1, so the agents must keep braiding the same
+# way, with the same winding numbers, as when every pair of agents is constrained.
+angles = np.linspace(np.pi, 0, 21)
+arc_trajectories = np.zeros((2, len(angles), 2))
+arc_trajectories[0] = 2 * np.stack((np.cos(angles), np.sin(angles)), axis=1)
+arc_trajectories[1] = [0, 0.05]
+winding_numbers = optimize.WindingNumbers(arc_trajectories)
+with contextlib.redirect_stdout(io.StringIO()):
+  for method in ['SLSQP', 'trust-constr', 'augmented-lagrangian']:
+    optimized_trajectories = optimize.Optimize(arc_trajectories, method=method, active_set=True)
+    assert np.allclose(optimize.WindingNumbers(optimized_trajectories), winding_numbers, atol=0.1)
+    assert np.isclose(np.sum(np.diff(optimized_trajectories, axis=1)**2),
+                      np.sum(np.diff(optimize.Optimize(arc_trajectories, method=method), axis=1)**2), atol=1e-3)
+
+# If every active set iteration changes how the agents braid, the problem is solved once
+# with every pair of agents, rather than returning the initial trajectories.
+max_active_set_iterations = optimize.MAX_ACTIVE_SET_ITERATIONS
+optimize.MAX_ACTIVE_SET_ITERATIONS = 1
+try:
+  for method in ['SLSQP', 'trust-constr', 'augmented-lagrangian']:
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+      optimized_trajectories = optimize.Optimize(arc_trajectories, method=method, active_set=True)
+    assert "Active set iterations ran out" in output.getvalue()
+    assert np.allclose(optimize.WindingNumbers(optimized_trajectories), winding_numbers, atol=0.1)
+    assert np.sum(np.diff(optimized_trajectories, axis=1)**2) < 0.5 * np.sum(np.diff(arc_trajectories, axis=1)**2)
+finally:
+  optimize.MAX_ACTIVE_SET_ITERATIONS = max_active_set_iterations
+
+# Five agents braid around each other. Moving agents through each other would shorten their
+# paths, so every method must keep the winding numbers, and find the same solution as SLSQP.
+word = braid_group.Word.FromCodes([-4, 3, -4, -4, -2, 3, 1, -2])
+braided_trajectories = utils.BraidToTrajectory(braid.Braid.Create(word=word, num_strands=5, uniform_duration=True), 40)
+winding_numbers = optimize.WindingNumbers(braided_trajectories)
+with contextlib.redirect_stdout(io.StringIO()):
+  slsqp_trajectories = optimize.Optimize(braided_trajectories)
+  assert np.allclose(optimize.WindingNumbers(slsqp_trajectories), winding_numbers, atol=0.1)
+  for method in ['trust-constr', 'augmented-lagrangian']:
+    optimized_trajectories = optimize.Optimize(braided_trajectories, method=method)
+    assert np.allclose(optimize.WindingNumbers(optimized_trajectories), winding_numbers, atol=0.1)
+    assert np.isclose(np.sum(np.diff(optimized_trajectories, axis=1)**2),
+                      np.sum(np.diff(slsqp_trajectories, axis=1)**2), atol=1e-3)
+
+# Test coarse to fine optimization --------------------------------------------
+# Resampling keeps the start and end positions, and is exact for straight lines.
+assert optimize.CoarseToFineTimestamps(9) == [9]
+assert optimize.CoarseToFineTimestamps(52) == [27, 52]
+assert optimize.CoarseToFineTimestamps(52, min_num_timestamps=3) == [3, 5, 8, 14, 27, 52]
+lines = np.linspace([[0, 0], [1, 2]], [[4, 2], [-1, 0]], 17, axis=1)
+for num_timestamps in [2, 5, 9, 17, 33]:
+  resampled_lines = optimize.ResampleTrajectories(lines, num_timestamps)
+  assert np.allclose(resampled_lines, np.linspace(lines[:, 0], lines[:, -1], num_timestamps, axis=1))
+assert np.allclose(optimize.ResampleTrajectories(optimize.ResampleTrajectories(trajectories, 17), num_timestamps=9), trajectories)
+
+# Coarse to fine optimization solves the same problem at full resolution.
+trajectories = optimize.ResampleTrajectories(trajectories, 17)
+pairs = optimize.CollisionPairs(2, 15)
+with contextlib.redirect_stdout(io.StringIO()):
+  for method in ['SLSQP', 'trust-constr', 'augmented-lagrangian']:
+    optimized_trajectories = optimize.OptimizeCoarseToFine(trajectories, method=method)
+    assert optimized_trajectories.shape == trajectories.shape
+    assert np.array_equal(optimized_trajectories[:, [0, -1]], trajectories[:, [0, -1]])
+    assert np.all(optimize.CollisionConstraints(optimized_trajectories[:, 1:-1], pairs) > -1e-6)
+    assert np.sum(np.diff(optimized_trajectories, axis=1)**2) < np.sum(np.diff(trajectories, axis=1)**2)
+
+# Coarse to fine optimization keeps the braid of the initial trajectories, even when a coarse
+# level would pass agents through each other.
+braid_trajectories = utils.BraidToTrajectory(braid.Braid.Create(word=braid_group.Word.FromCodes([-2, -1, 2, -1]), num_strands=3), 50)
+braid_trajectories = utils.AttachEndpoints(braid_trajectories, [(-1.0, 0.0), (0.0, -1.0), (1.0, -1.0)],
+                                           [(2.0, 0.0), (0.0, 1.0), (1.0, 1.0)])
+with contextlib.redirect_stdout(io.StringIO()):
+  for min_num_timestamps in [9, optimize.MIN_COARSE_TIMESTAMPS]:
+    optimized_trajectories = optimize.OptimizeCoarseToFine(braid_trajectories, min_num_timestamps=min_num_timestamps)
+    assert np.allclose(optimize.WindingNumbers(optimized_trajectories), optimize.WindingNumbers(braid_trajectories), atol=0.1)
@@ -16,17 +16,10 @@ for word in tqdm.tqdm(words):
   initial_trajectories = utils.BraidToTrajectory(next_braid, num_timestamps)
 
   # Connect start locations to work space. Simulate 3 agent crossing scenario.
-  initial_trajectories[0].insert(0, (-1.0, 0.0))
-  initial_trajectories[1].insert(0, (0.0, -1.0))
-  initial_trajectories[2].insert(0, (1.0, -1.0))
-  num_timestamps += 1
-
   # Connect end locations to work space. X positions ordered as 1, 2, 0 (permutation induced by crossing).
-  initial_trajectories[0].append((2.0, 0.0))
-  initial_trajectories[1].append((0.0, 1.0))
-  initial_trajectories[2].append((1.0, 1.0))
-
-  num_timestamps += 1
+  initial_trajectories = utils.AttachEndpoints(initial_trajectories,
+                                               start_positions=[(-1.0, 0.0), (0.0, -1.0), (1.0, -1.0)],
+                                               end_positions=[(2.0, 0.0), (0.0, 1.0), (1.0, 1.0)])
 
   optimized_trajectories = optimize.Optimize(initial_trajectories)
 
@@ -12,14 +12,11 @@ braid = braid.Braid.Create(word=word, num_strands=num_agents)
 initial_trajectories = utils.BraidToTrajectory(braid, num_timestamps)
 
 # Connect start locations to work space. Simulate 2 agent crossing scenario.
-initial_trajectories[0].insert(0, (-1.0, 0.0))
-initial_trajectories[1].insert(0, (0.0, -1.0))
-num_timestamps += 1
-
 # Connect end locations to work space. X positions ordered as 2, 1 (permutation induced by crossing).
-initial_trajectories[0].append((1.0, 0.0))
-initial_trajectories[1].append((0.0, 1.0))
-num_timestamps += 1
+initial_trajectories = utils.AttachEndpoints(initial_trajectories,
+                                             start_positions=[(-1.0, 0.0), (0.0, -1.0)],
+                                             end_positions=[(1.0, 0.0), (0.0, 1.0)])
+num_timestamps += 2
 
 optimized_trajectories = optimize.Optimize(initial_trajectories)
 
@@ -1,3 +1,5 @@
+import itertools
+import math
 import permutation
 import numpy as np
 
@@ -30,7 +32,92 @@ assert p == (1, 2, 0)
 
 # When viewed along a direction close to +y (slightly tilted), the permutation is
 # the same for this system. Note that viewing along exactly the +y axis leads multiple
-# start and end points to be projected to the same point along the direction vector,
-# which is an error for us.
+# start and end points to be projected to the same point along the direction vector.
 p = permutation.permutation_for_system(start_positions, end_positions, direction=np.array([0.05, 1]))
-assert p == (1, 2, 0)
\ No newline at end of file
+assert p == (1, 2, 0)
+
+# Such ties are broken along the perpendicular direction (here -x), then by index.
+start_order, end_order = permutation.start_end_permutations(start_positions, end_positions, direction=np.array([0, 1]))
+assert list(start_order) == [2, 1, 0] and list(end_order) == [0, 2, 1]
+start_order, _ = permutation.start_end_permutations([np.array([1, 1]), np.array([0, 0]), np.array([1, 1])],
+                                                    end_positions, direction=np.array([1, 1]))
+assert list(start_order) == [1, 0, 2]
+
+# Minimal inversion projection directions -------------------------------------
+assert permutation.num_inversions((0, 1, 2)) == 0
+assert permutation.num_inversions((1, 2, 0)) == 2
+assert permutation.num_inversions((3, 2, 1, 0)) == 6
+
+# Along x, agents swap ends, but along y they keep their order.
+start_positions = [np.array([-1, 0]), np.array([1, 1])]
+end_positions = [np.array([1, 0]), np.array([-1, 1])]
+assert permutation.permutation_for_system(start_positions, end_positions) == (1, 0)
+direction = permutation.minimal_inversion_direction(start_positions, end_positions)
+assert permutation.permutation_for_system(start_positions, end_positions, direction) == (0, 1)
+assert np.isclose(np.linalg.norm(direction), 1)
+
+# The direction is as good as any other direction.
+rng = np.random.default_rng(0)
+test_directions = [np.array([np.cos(a), np.sin(a)]) for a in np.linspace(0, 2 * np.pi, 1441)]
+for num_agents in [1, 3, 5, 7]:
+  start_positions = list(rng.normal(size=(num_agents, 2)))
+  end_positions = list(rng.normal(size=(num_agents, 2)))
+  direction = permutation.minimal_inversion_direction(start_positions, end_positions)
+  num_inversions = permutation.num_inversions(permutation.permutation_for_system(start_positions, end_positions, direction))
+  assert all(num_inversions <= permutation.num_inversions(permutation.permutation_for_system(start_positions, end_positions, d))
+             for d in test_directions)
+  assert np.array_equal(direction, permutation.minimal_inversion_direction(start_positions, end_positions))
+
+# Directions d and -d can give different numbers of inversions, e.g. here only directions
+# pointing left avoid every inversion.
+start_positions = [np.array([-0.6, 1.7]), np.array([-2.2, -1.1]), np.array([0.7, -2.2])]
+end_positions = [np.array([-0.4, -1.3]), np.array([0.3, 0.0]), np.array([-0.1, 0.0])]
+direction = permutation.minimal_inversion_direction(start_positions, end_positions)
+assert permutation.num_inversions(permutation.permutation_for_system(start_positions, end_positions, direction)) == 0
+assert permutation.num_inversions(permutation.permutation_for_system(start_positions, end_positions, -direction)) > 0
+
+# Permutation ranks -----------------------------------------------------------
+assert permutation.permutation_rank((0, 1, 2)) == 0
+assert permutation.permutation_rank((0, 2, 1)) == 1
+assert permutation.permutation_rank((2, 1, 0)) == 5
+assert permutation.permutation_unrank(5, 3) == (2, 1, 0)
+
+# Ranks follow lexicographic order, and round trip through unranking.
+all_permutations = list(itertools.permutations(range(5)))
+for rank, p in enumerate(all_permutations):
+  assert permutation.permutation_rank(p) == rank
+  assert permutation.permutation_unrank(rank, 5) == p
+
+  # Swapping adjacent values updates the rank incrementally.
+  for i in range(4):
+    swapped = list(p)
+    swapped[i], swapped[i + 1] = swapped[i + 1], swapped[i]
+    assert permutation.adjacent_swap_rank(p, rank, i) == permutation.permutation_rank(tuple(swapped))
+
+# Permutations of up to 12 elements fit in a 32-bit integer, and larger ones are ranked too.
+assert permutation.permutation_rank(tuple(reversed(range(12)))) < 2**32
+p = tuple(np.random.default_rng(0).permutation(20).tolist())
+assert permutation.permutation_unrank(permutation.permutation_rank(p), 20) == p
+assert permutation.permutation_rank(tuple(reversed(range(20)))) == math.factorial(20) - 1
+
+# Batched permutations --------------------------------------------------------
+rng = np.random.default_rng(1)
+start_positions = rng.normal(size=(8, 5, 2))
+end_positions = rng.normal(size=(8, 5, 2))
+directions = np.array([[1, 0], [0, 1], [np.cos(1), np.sin(1)]])
+permutations, inversions = permutation.batch_permutations_for_systems(start_positions, end_positions, directions)
+assert permutations.shape == (8, 3, 5) and inversions.shape == (8, 3)
+for b in range(8):
+  for d in range(3):
+    p = permutation.permutation_for_system(list(start_positions[b]), list(end_positions[b]), directions[d])
+    assert tuple(permutations[b, d]) == p
+    assert inversions[b, d] == permutation.num_inversions(p)
+
+# Directions default to [1, 0], and ties are broken as for a single system.
+start_positions = np.array([[[-1, 0], [0, -1], [1, -1]]])
+end_positions = np.array([[[2, 0], [0, 1], [1, 1]]])
+permutations, inversions = permutation.batch_permutations_for_systems(start_positions, end_positions)
+assert permutations.tolist() == [[[1, 2, 0]]] and inversions.tolist() == [[2]]
+permutations, _ = permutation.batch_permutations_for_systems(start_positions, end_positions, np.array([[0, 1]]))
+assert (tuple(permutations[0, 0]) ==
+        permutation.permutation_for_system(list(start_positions[0]), list(end_positions[0]), np.array([0, 1])))
@@ -5,7 +5,6 @@ import numpy as np
 import optimize
 import os
 import permutation
-import random
 import sample
 import shutil
 import tqdm
@@ -31,33 +30,35 @@ end_positions = [row / np.linalg.norm(row) for row in np.random.multivariate_nor
 print(f"Start positions: {np.array(start_positions)}")
 print(f"End positions: {np.array(end_positions)}")
 
-# Determine the resulting system permutation.
-start_order, end_order = permutation.start_end_permutations(start_positions, end_positions)
-P = permutation.permutation_for_system(start_positions, end_positions)
-print(f"Got system permutation: {P}")
+# Determine the resulting system permutation, projecting along the direction that needs the
+# fewest crossings.
+direction = permutation.minimal_inversion_direction(start_positions, end_positions)
+start_order, end_order = permutation.start_end_permutations(start_positions, end_positions, direction)
+P = permutation.permutation_for_system(start_positions, end_positions, direction)
+print(f"Got system permutation: {P} ({permutation.num_inversions(P)} inversions) along direction {direction}")
 
 # Find braid words that match this permutation.
 print("Searching for braid words that fit this permutation (this may take a minute)...")
-words = sample.sample_braids(goal_permutation=P, stop_after_num_matches=1000)
-print(f"Stopped after finding {len(words)} suitable braid words.")
-words = random.sample(words, min(len(words), 20))
-print(f"Sampled down to {len(words)} suitable braid words.")
+words = sample.iter_braids(goal_permutation=P, stop_after_num_matches=1000)
+# `distinct_braids` holds every distinct braid seen, at most the 1000 matches searched for.
+words = sample.reservoir_sample(sample.distinct_braids(words), k=20)
+print(f"Sampled {len(words)} distinct braids out of the first 1000 suitable braid words found.")
 
 # For each word, construct an initial, braid, optimize it, and display it.
-num_timestamps = 75
+# Commuting crossings are performed simultaneously, and each step of the braid is sampled
+# with a fixed number of timestamps.
+timestamps_per_step = 4
 for word in tqdm.tqdm(words):
   # Create an initial trajectory from the braid.
   print("Initializing trajectory...")
-  next_braid = braid.Braid.Create(word=word, num_strands=num_agents)
-  initial_trajectories = utils.BraidToTrajectory(braid=next_braid, 
-                                                 num_timestamps=num_timestamps, 
-                                                 num_segments=len(word.characters) + 1)
+  num_timestamps = timestamps_per_step * (len(word.Layers()) + 1) + 1
+  next_braid = braid.Braid.Create(word=word, num_strands=num_agents, uniform_duration=True, layered=True)
+  initial_trajectories = utils.BraidToTrajectory(braid=next_braid, num_timestamps=num_timestamps)
 
   # Attach the start and end positions for each agent to the braid.
-  # TODO(erik): Util function for this.
-  for i in range(num_agents):
-    initial_trajectories[i].insert(0, start_positions[start_order[i]])
-    initial_trajectories[i].append(end_positions[end_order[i]])
+  initial_trajectories = utils.AttachEndpoints(initial_trajectories,
+                                               start_positions=[start_positions[k] for k in start_order],
+                                               end_positions=[end_positions[k] for k in end_order])
 
   # Optimize the trajectory.
   print("Optimizing trajectory...")
@@ -1,5 +1,9 @@
+import contextlib
+import permutation
+import random
 import sample
 import braid_group
+import time
 
 # Test unsortedness helper function -------------------------------------------
 assert sample.unsortedness((0,), (0,)) == 0
@@ -64,3 +68,196 @@ assert words[0].characters[0].i == 0
 assert len(words[1].characters) == 1
 assert isinstance(words[1].characters[0], braid_group.InverseGenerator)
 assert words[1].characters[0].i == 0
+
+# Braids on more than 12 strands, whose permutation ranks exceed 32 bits.
+goal_permutation = (0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 12)
+words = sample.sample_braids(goal_permutation, stop_after_num_matches=2)
+assert [w.__str__() for w in words] == ["g12", "inv(g12)"]
+
+# Test search nodes -----------------------------------------------------------
+root = sample.Node.root(num_strands=3)
+assert root.permutation(3) == (0, 1, 2) and root.depth == 0
+assert root.word().__str__() == "id"
+node = root.child(1, root.permutation(3))
+node = node.child(-2, node.permutation(3))
+assert node.permutation(3) == sample.permutation_for_word(gens[0].Compose(invs[1]), num_strands=3)
+assert node.rank == permutation.permutation_rank(node.permutation(3))
+assert node.depth == 2
+assert node.word().__str__() == "g0 * inv(g1)"
+
+# Words on three strands ------------------------
+# Every match achieves the goal permutation, and the search order is deterministic.
+words = sample.sample_braids(goal_permutation=(1, 2, 0))
+assert len(words) == 20
+assert all(sample.permutation_for_word(w, num_strands=3) == (1, 2, 0) for w in words)
+assert [w.__str__() for w in words[:2]] == [w.__str__() for w in sample.sample_braids((1, 2, 0), stop_after_num_matches=2)]
+
+# Test incremental unsortedness helpers ---------------------------------------
+goal = (3, 0, 4, 1, 2)
+goal_index = sample.goal_index_table(goal)
+assert all(goal[goal_index[v]] == v for v in range(5))
+values = (2, 4, 0, 1, 3)
+for i in range(4):
+  swapped = list(values)
+  swapped[i], swapped[i+1] = swapped[i+1], swapped[i]
+  expected = sample.unsortedness(tuple(swapped), goal) - sample.unsortedness(values, goal)
+  assert sample.unsortedness_delta(values, goal_index, i) == expected
+
+# Test lazy braid sampling ----------------------------------------------------
+# Lazily sampled words match the eagerly sampled ones.
+words = sample.sample_braids(goal_permutation=(2, 0, 3, 1), stop_after_num_matches=50)
+lazy_words = sample.iter_braids(goal_permutation=(2, 0, 3, 1))
+assert [w.__str__() for w in words] == [next(lazy_words).__str__() for _ in range(50)]
+
+# Reservoir sampling returns everything when there are fewer than k items, and otherwise
+# returns k distinct items.
+assert sorted(sample.reservoir_sample(range(5), k=10)) == list(range(5))
+rng = random.Random(0)
+sampled = sample.reservoir_sample(sample.iter_braids(goal_permutation=(2, 0, 3, 1), stop_after_num_matches=200), k=20, rng=rng)
+assert len(sampled) == 20 and len(set(w.__str__() for w in sampled)) == 20
+
+# Filtering distinct braids keeps the first word for each braid, in order.
+words = sample.sample_braids(goal_permutation=(1, 2, 0))
+distinct_words = list(sample.distinct_braids(iter(words)))
+assert [w.__str__() for w in distinct_words] == [w.__str__() for w in dict.fromkeys(words)]
+assert len(distinct_words) < len(words) and len(set(distinct_words)) == len(distinct_words)
+
+# Every item is (roughly) equally likely to be sampled.
+counts = [0] * 10
+for _ in range(5000):
+  for item in sample.reservoir_sample(range(10), k=3, rng=rng):
+    counts[item] += 1
+assert all(abs(count / 5000 - 0.3) < 0.03 for count in counts)
+
+# Test search configuration and budgets ---------------------------------------
+# An exhaustive search reports that it searched everything.
+stats = sample.SearchStats()
+words = sample.sample_braids(goal_permutation=(1, 2, 0), stats=stats)
+assert stats.stop_reason == sample.StopReason.EXHAUSTED
+assert stats.num_nodes > 0
+
+stats = sample.SearchStats()
+words = sample.sample_braids(goal_permutation=(1, 2, 0), stop_after_num_matches=3, stats=stats)
+assert len(words) == 3 and stats.stop_reason == sample.StopReason.MATCH_LIMIT
+
+# Limiting the search depth limits word length.
+words = sample.sample_braids(goal_permutation=(2, 0, 3, 1), max_depth=5)
+assert words and all(len(w.codes) <= 5 for w in words)
+assert len(words) < len(sample.sample_braids(goal_permutation=(2, 0, 3, 1), max_depth=7))
+
+# Relaxing the search finds more words.
+num_words = len(sample.sample_braids(goal_permutation=(1, 2, 0), max_depth=6))
+num_revisiting_words = len(sample.sample_braids(goal_permutation=(1, 2, 0), max_depth=6, max_revisits=1))
+assert num_revisiting_words > num_words
+assert len(sample.sample_braids(goal_permutation=(1, 2, 0), max_depth=6, max_revisits=1,
+                                max_unsortedness_increase=2)) > num_revisiting_words
+
+# Budgets stop the search early, returning the matches found so far.
+stats = sample.SearchStats()
+words = sample.sample_braids(goal_permutation=(3, 2, 1, 0), max_nodes=100, stats=stats)
+assert stats.stop_reason == sample.StopReason.MAX_NODES and stats.num_nodes == 100
+assert words == sample.sample_braids(goal_permutation=(3, 2, 1, 0), stop_after_num_matches=len(words))
+
+stats = sample.SearchStats()
+words = sample.sample_braids(goal_permutation=(5, 4, 3, 2, 1, 0), time_limit=0.1, stats=stats)
+assert stats.stop_reason == sample.StopReason.TIME_LIMIT and words
+
+# Test shortest first braid sampling ------------------------------------------
+assert sample.inversions((0, 1, 2), (0, 1, 2)) == 0
+assert sample.inversions((2, 1, 0), (0, 1, 2)) == 3
+assert sample.inversions((1, 2, 0), (2, 0, 1)) == 2
+
+for goal_permutation in [(1, 2, 0), (2, 0, 3, 1)]:
+  for max_revisits in [0, 1]:
+    words = sample.sample_braids(goal_permutation, max_revisits=max_revisits, max_depth=7)
+    shortest_words = sample.sample_braids(goal_permutation, max_revisits=max_revisits, max_depth=7,
+                                          shortest_first=True)
+    # The same words are found, shortest first.
+    assert sorted(str(w) for w in shortest_words) == sorted(str(w) for w in words)
+    lengths = [len(w.codes) for w in shortest_words]
+    assert lengths == sorted(lengths)
+    assert lengths[0] == sample.inversions(tuple(range(len(goal_permutation))), goal_permutation)
+
+# A match limit returns the shortest words.
+stats = sample.SearchStats()
+words = sample.sample_braids(goal_permutation=(2, 0, 3, 1), stop_after_num_matches=5, max_revisits=1,
+                             shortest_first=True, stats=stats)
+assert [len(w.codes) for w in words] == [3] * 5 and stats.stop_reason == sample.StopReason.MATCH_LIMIT
+
+try:
+  sample.sample_braids(goal_permutation=(1, 2, 0), shortest_first=True, workers=2)
+  assert False
+except ValueError:
+  pass
+
+# Test pruning redundant words ------------------------------------------------
+for goal_permutation in [(2, 0, 3, 1), (2, 0, 1, 4, 3)]:
+  stats = sample.SearchStats()
+  words = sample.sample_braids(goal_permutation, stats=stats)
+  pruned_stats = sample.SearchStats()
+  pruned_words = sample.sample_braids(goal_permutation, prune_redundant=True, stats=pruned_stats)
+  assert pruned_stats.num_nodes * 3 < stats.num_nodes
+
+  # Pruned words are never cancelled or out of order, and cover all the shortest braids.
+  for w in pruned_words:
+    for a, b in zip(w.codes[:-1], w.codes[1:]):
+      assert b != -a and abs(b) - 1 > abs(a) - 3
+  assert set(pruned_words) <= set(words)
+  num_crossings = sample.inversions(tuple(range(len(goal_permutation))), goal_permutation)
+  assert ({w for w in pruned_words if len(w.codes) == num_crossings} ==
+          {w for w in words if len(w.codes) == num_crossings})
+
+# Test parallel braid sampling ------------------------------------------------
+# Worker processes re-import the main module on some platforms, so only search from here.
+if __name__ == '__main__':
+  for goal_permutation in [(1, 2, 0), (3, 2, 1, 0), (2, 0, 3, 1, 4)]:
+    for stop_after_num_matches in [1, 7, 50]:
+      words = sample.sample_braids(goal_permutation, stop_after_num_matches)
+      parallel_words = sample.sample_braids(goal_permutation, stop_after_num_matches, workers=2)
+      assert [str(w) for w in parallel_words] == [str(w) for w in words]
+
+  words = sample.sample_braids(goal_permutation=(2, 0, 3, 1), max_depth=7, max_revisits=1)
+  parallel_words = sample.sample_braids(goal_permutation=(2, 0, 3, 1), max_depth=7, max_revisits=1, workers=3)
+  assert [str(w) for w in parallel_words] == [str(w) for w in words]
+
+  # Budgets are shared by all workers. At most `max_nodes` nodes are expanded in total, and
+  # the matches are a prefix of the matches of a single process search.
+  all_words = [str(w) for w in sample.sample_braids(goal_permutation=(2, 0, 3, 1, 4), max_depth=9)]
+  for max_nodes in [5, 300, 2000]:
+    stats = sample.SearchStats()
+    parallel_words = sample.sample_braids(goal_permutation=(2, 0, 3, 1, 4), max_depth=9, max_nodes=max_nodes,
+                                          stats=stats, workers=2)
+    assert stats.num_nodes <= max_nodes and stats.stop_reason == sample.StopReason.MAX_NODES
+    assert [str(w) for w in parallel_words] == all_words[:len(parallel_words)]
+
+  # Workers stop once enough matches are found before their subtrees, and return the nodes
+  # they reserved but did not expand to the shared budget.
+  search = sample._Search((2, 0, 3, 1))
+  root = sample.Node.root(4, (2, 0, 3, 1))
+  state = sample._SharedSearchState([False, True], max_nodes=1000, num_queues=1)
+  sample._init_worker(state)
+  state.match_counts[0] = 3
+  stats = sample._search_subtree(search, root, 1, 0, stop_after_num_matches=3, deadline=None)
+  words, chunk_stats = state.match_queues[0].get(timeout=1)
+  assert words == [] and chunk_stats.stop_reason == stats.stop_reason == sample.StopReason.CANCELLED
+  assert stats.num_nodes == 0
+  stats = sample._search_subtree(search, root, 1, 0, stop_after_num_matches=5, deadline=None)
+  words = []
+  while True:
+    chunk, chunk_stats = state.match_queues[0].get(timeout=1)
+    words.extend(chunk)
+    if chunk_stats is not None:
+      break
+  assert len(words) == 2 and chunk_stats.stop_reason == stats.stop_reason == sample.StopReason.MATCH_LIMIT
+  assert state.match_counts[1] == 2 and state.node_budget.value == 1000 - stats.num_nodes
+
+  # A matching root is only found once, and only if the budget allows expanding it.
+  for workers in [1, 2]:
+    assert sample.sample_braids((0, 1, 2), max_nodes=0, workers=workers) == []
+    assert [str(w) for w in sample.sample_braids((0, 1, 2), max_depth=0, workers=workers)] == ['id']
+
+  # Matches are yielded as the workers find them, without waiting for whole subtrees.
+  start_time = time.monotonic()
+  with contextlib.closing(sample.iter_braids((3, 6, 1, 5, 0, 4, 2), workers=2)) as words:
+    assert str(next(words)) == str(next(sample.iter_braids((3, 6, 1, 5, 0, 4, 2))))
+  assert time.monotonic() - start_time < 10
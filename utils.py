@@ -17,9 +17,16 @@ from typing import List, Tuple
 # squishes the previous intervals, reducing their time by half. In order to evenly sample
 # each function, we invert this scaling in this function, making sure to sample the same number 
 # of timestamps in each of [0.5, 1], [0.25, 0.5], [0.125, 0.25], [0.0625, 0.125], ...
+#
+# Braids created with `uniform_duration` do not need rescaling. For those, `num_segments` is
+# ignored and exactly `num_timestamps` evenly spaced timestamps are sampled, including the
+# start and end of the braid.
 def BraidToTrajectory(braid: braid.Braid, 
                       num_timestamps: int = 10, 
-                      num_segments: int = 1) -> List[List[Tuple[float, float]]]:
+                      num_segments: int = 1) -> np.ndarray:
+  if braid.uniform_duration:
+    return braid.Sample(np.linspace(0, 1, num_timestamps))
+
   # Generate time intervals for `num_segments` segments.
   intervals = []
   start, end = 0, 1
@@ -31,25 +38,24 @@ def BraidToTrajectory(braid: braid.Braid,
   intervals.reverse()
   timestamps_per_interval = int(np.ceil(num_timestamps / len(intervals)))
 
-  # Generate one trajectory per braid strand.
-  trajectories = []
-  num_agents = len(braid.strands)
-  for i in range(num_agents):
-    trajectory = []
-
-    # Sample an even number of timestamps from each interval.
-    for interval in intervals:
-      for t in np.linspace(interval[0], interval[1], timestamps_per_interval, endpoint=False):
-        position = braid.Strand(i).AtTime(t)
-        trajectory.append((position[0], position[1]))
-
-    # Always sample the endpoint of the braid as well.
-    position = braid.Strand(i).AtTime(1)
-    trajectory.append((position[0], position[1]))
+  # Sample an even number of timestamps from each interval, and always sample the endpoint
+  # of the braid as well.
+  ts = [np.linspace(interval[0], interval[1], timestamps_per_interval, endpoint=False) for interval in intervals]
+  ts = np.concatenate(ts + [[1.0]])
 
-    trajectories.append(trajectory)
-
-  return trajectories
+  # Generate one trajectory per braid strand.
+  return braid.Sample(ts)
+
+# Attach start and end positions to each of a set of trajectories. The output is an array of size:
+#    num_agents x (num_timestamps + 2) x 2
+# where start_positions[a] is prepended to, and end_positions[a] is appended to, the a'th trajectory.
+def AttachEndpoints(trajectories: np.ndarray,
+                    start_positions: List[Tuple[float, float]],
+                    end_positions: List[Tuple[float, float]]) -> np.ndarray:
+  trajectories = np.asarray(trajectories, dtype=float)
+  start_positions = np.asarray(start_positions, dtype=float)[:, None, :]
+  end_positions = np.asarray(end_positions, dtype=float)[:, None, :]
+  return np.concatenate([start_positions, trajectories, end_positions], axis=1)
 
 # Plot a set of input trajectories to an output file. This produces a 2x2 grid of subplots showing
 # various cross sections of the (x, y, t) input trajectories.